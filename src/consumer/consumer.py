@@ -1,6 +1,8 @@
 import asyncio
 import json
 import os
+import time
+from collections import defaultdict
 from datetime import datetime
 
 import aio_pika
@@ -8,16 +10,38 @@ import aio_pika
 from helpers.logging import setup_logger
 from helpers.rabbitmq import RabbitMQClient
 from postgresql.config.db import session
-from postgresql.database_scripts.authors import insert_author
-from postgresql.database_scripts.authors_reporting import insert_author_stats
-from postgresql.database_scripts.challenges import insert_or_update_challenge
-from postgresql.database_scripts.music import insert_music
-from postgresql.database_scripts.posts import insert_post
-from postgresql.database_scripts.posts_challenges import insert_post_challenge
-from postgresql.database_scripts.posts_reporting import insert_post_stats
+from postgresql.database_scripts.authors import insert_author_batch
+from postgresql.database_scripts.authors_reporting import insert_author_stats_batch
+from postgresql.database_scripts.challenges import insert_or_update_challenge_batch
+from postgresql.database_scripts.music import insert_music_batch
+from postgresql.database_scripts.posts import insert_post_batch
+from postgresql.database_scripts.posts_challenges import insert_post_challenge_batch
+from postgresql.database_scripts.posts_reporting import insert_post_stats_batch
 
 logger = setup_logger("consumer")
 
+# Columns of the ON CONFLICT clause of every table. The rows of a batch are written in
+# this order so consumers lock the same rows in the same order and can't deadlock.
+CONFLICT_KEYS = {
+    "authors": ("id",),
+    "authors_reporting": ("id", "collected_at"),
+    "music": ("id",),
+    "posts": ("id",),
+    "posts_reporting": ("id", "collected_at"),
+    "challenges": ("id",),
+    "posts_challenges": ("post_id", "challenge_id"),
+}
+
+
+def to_int(value):
+    """
+    TikTok sends some counters as strings, convert them for the BIGINT columns
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
 
 class TikTokConsumer(RabbitMQClient):
     def __init__(
@@ -31,11 +55,21 @@ class TikTokConsumer(RabbitMQClient):
         self.connection_name = "tiktok_data_consumer"
         self.input_queue = os.environ.get("RABBITMQ_HASHTAG_QUEUE")
 
+        # Messages are written to the database in batches of up to batch_size messages,
+        # a batch is flushed early when its oldest message waited batch_timeout seconds
+        self.batch_size = int(os.environ.get("CONSUMER_BATCH_SIZE") or 100)
+        self.batch_timeout = (
+            int(os.environ.get("CONSUMER_BATCH_TIMEOUT_MS") or 500) / 1000
+        )
+        self.batch = []
+        self.batch_ready = asyncio.Event()
+
     async def initialize(self):
         try:
             await self.connect(self.connection_name)
             self.queue = await self.channel.get_queue(name=self.input_queue)
-            await self.channel.set_qos(prefetch_count=100)
+            # Keep the next batch coming in while the current one is written
+            await self.channel.set_qos(prefetch_count=2 * self.batch_size)
 
             logger.info(f"Initialized TikTokConsumer")
             logger.debug(
@@ -47,121 +81,213 @@ class TikTokConsumer(RabbitMQClient):
     async def consume_messages(self):
         try:
             await self.queue.consume(callback=self.process_message)
-            logger.info(f"Consuming messages from queue: {self.queue.name}")
+            logger.info(
+                f"Consuming messages from queue: {self.queue.name} "
+                f"in batches of {self.batch_size}"
+            )
+            flusher = asyncio.create_task(self.flush_batches())
             try:
                 await asyncio.Future()
             finally:
+                flusher.cancel()
                 await self.connection.close()
         except Exception as e:
             logger.error(f"Error consuming tasks: {e}")
 
     async def process_message(self, message: aio_pika.IncomingMessage):
-        try:
-            async with message.process(requeue=True):
-                routing_key = message.routing_key
-                hashtag = routing_key.split(".")[2]
-                tiktok_data = json.loads(message.body.decode("utf-8"))
+        # Messages are acked by flush_batches once their batch is committed
+        self.batch.append(message)
+        if len(self.batch) >= self.batch_size:
+            self.batch_ready.set()
 
-                logger.info(
-                    f"Processing video {tiktok_data.get('id')} for hashtag {hashtag}"
+    async def flush_batches(self):
+        """
+        Write the collected messages to the database, one batch at a time
+        """
+        while True:
+            # Flush when the batch is full, or with whatever arrived before the timeout
+            try:
+                await asyncio.wait_for(
+                    self.batch_ready.wait(), timeout=self.batch_timeout
                 )
+            except asyncio.TimeoutError:
+                pass
+            self.batch_ready.clear()
+
+            batch = self.batch[: self.batch_size]
+            self.batch = self.batch[self.batch_size :]
+            if len(self.batch) >= self.batch_size:
+                self.batch_ready.set()
+
+            if batch:
+                await self.process_batch(batch)
+
+    async def process_batch(self, messages):
+        """
+        Store a batch of messages in one transaction and ack them after the commit
+
+        When the transaction fails the messages are retried one by one, so a single
+        bad message doesn't keep the whole batch from being stored.
+        """
+        started_at = time.monotonic()
+
+        decoded = []
+        for message in messages:
+            try:
+                decoded.append((message, json.loads(message.body.decode("utf-8"))))
+            except Exception as e:
+                logger.error(f"Error decoding message {message.routing_key}: {e}")
+                await message.reject()
+
+        if not decoded:
+            return
+
+        items = [item for _, item in decoded]
+        try:
+            await self.process_tiktok_items(items)
+        except Exception as e:
+            logger.error(f"Error processing batch of {len(items)} videos: {e}")
+            if len(decoded) > 1:
+                for message, item in decoded:
+                    await self.process_single(message, item)
+            else:
+                for message, _ in decoded:
+                    await message.reject(requeue=True)
+            return
+
+        for message, _ in decoded:
+            await message.ack()
 
-                await self.process_tiktok_item(tiktok_data)
+        logger.info(
+            f"Processed batch of {len(items)} videos "
+            f"in {(time.monotonic() - started_at) * 1000:.0f}ms"
+        )
+
+    async def process_single(self, message, item):
+        try:
+            await self.process_tiktok_items([item])
         except Exception as e:
-            logger.error(f"Error processing video: {e}")
+            logger.error(f"Error processing video {item.get('id')}: {e}")
+            await message.reject(requeue=True)
+            return
+        await message.ack()
+
+    def collect_rows(self, item, rows):
+        """
+        Add the rows of every table for a TikTok item to rows
+        """
+        author_data = item.get("author", {})
+        authorStats_data = item.get("authorStats", {})
+        music_data = item.get("music", {})
+        stats_data = item.get("statsV2", {})
+        collected_at = datetime.fromisoformat(item.get("collected_at"))
+        url = f"https://www.tiktok.com/@{author_data.get('uniqueId')}/video/{item.get('id')}"
+
+        rows["authors"].append(
+            {
+                "id": author_data.get("id"),
+                "nickname": author_data.get("nickname"),
+                "signature": author_data.get("signature"),
+                "unique_id": author_data.get("uniqueId"),
+                "verified": author_data.get("verified"),
+            }
+        )
+        rows["authors_reporting"].append(
+            {
+                "id": author_data.get("id"),
+                "collected_at": collected_at,
+                "digg_count": authorStats_data.get("diggCount"),
+                "follower_count": authorStats_data.get("followerCount"),
+                "following_count": authorStats_data.get("followingCount"),
+                "heart_count": authorStats_data.get("heartCount"),
+                "video_count": authorStats_data.get("videoCount"),
+            }
+        )
+        rows["music"].append(
+            {
+                "id": music_data.get("id"),
+                "author_name": music_data.get("authorName"),
+                "title": music_data.get("title"),
+                "duration": music_data.get("duration"),
+                "original": music_data.get("original"),
+            }
+        )
+        rows["posts"].append(
+            {
+                "id": item.get("id"),
+                "created_at": item.get("createTime"),
+                "description": item.get("desc"),
+                "duet_enabled": item.get("duetEnabled"),
+                "duet_from_id": item.get("duetInfo", {}).get("duetFromId"),
+                "is_ad": item.get("isAd"),
+                "can_repost": item.get("item_control", {}).get("can_repost"),
+                "author_id": author_data.get("id"),
+                "music_id": music_data.get("id"),
+                "url": url,
+            }
+        )
+        rows["posts_reporting"].append(
+            {
+                "id": item.get("id"),
+                "collected_at": collected_at,
+                "collect_count": to_int(stats_data.get("collectCount")),
+                "comment_count": to_int(stats_data.get("commentCount")),
+                "digg_count": to_int(stats_data.get("diggCount")),
+                "play_count": to_int(stats_data.get("playCount")),
+                "repost_count": to_int(stats_data.get("repostCount")),
+                "share_count": to_int(stats_data.get("shareCount")),
+                "url": url,
+            }
+        )
+        for challenge_data in item.get("challenges", []):
+            rows["challenges"].append(
+                {
+                    "id": challenge_data.get("id"),
+                    "title": challenge_data.get("title"),
+                    "description": challenge_data.get("desc"),
+                }
+            )
+            rows["posts_challenges"].append(
+                {
+                    "post_id": item.get("id"),
+                    "challenge_id": challenge_data.get("id"),
+                }
+            )
+
+    async def process_tiktok_items(self, items):
+        # Process TikTok items and store in database within a transaction block
+        rows = defaultdict(list)
+        for item in items:
+            self.collect_rows(item, rows)
+        for table, keys in CONFLICT_KEYS.items():
+            rows[table].sort(key=lambda row: tuple(str(row[key]) for key in keys))
 
-    async def process_tiktok_item(self, item):
-        # Process TikTok item and store in database within a transaction block
         async with session() as s:
             async with s.begin():
                 try:
-                    # Process Author
-                    author_data = item.get("author", {})
-                    authorStats_data = item.get("authorStats", {})
-
-                    await insert_author(
-                        id=author_data.get("id"),
-                        nickname=author_data.get("nickname"),
-                        signature=author_data.get("signature"),
-                        unique_id=author_data.get("uniqueId"),
-                        verified=author_data.get("verified"),
-                        session=s,
-                    )
-
-                    # Process Author Stats
-                    await insert_author_stats(
-                        id=author_data.get("id"),
-                        collected_at=datetime.fromisoformat(item.get("collected_at")),
-                        digg_count=authorStats_data.get("diggCount"),
-                        follower_count=authorStats_data.get("followerCount"),
-                        following_count=authorStats_data.get("followingCount"),
-                        heart_count=authorStats_data.get("heartCount"),
-                        video_count=authorStats_data.get("videoCount"),
-                        session=s,
-                    )
-
-                    # Process Music
-                    music_data = item.get("music", {})
-                    await insert_music(
-                        id=music_data.get("id"),
-                        author_name=music_data.get("authorName"),
-                        title=music_data.get("title"),
-                        duration=music_data.get("duration"),
-                        original=music_data.get("original"),
-                        session=s,
+                    # Every table is written with one statement, parents before children
+                    await insert_author_batch(rows["authors"], session=s)
+                    await insert_author_stats_batch(
+                        rows["authors_reporting"], session=s
                     )
-
-                    # Process Video
-                    await insert_post(
-                        id=item.get("id"),
-                        created_at=item.get("createTime"),
-                        description=item.get("desc"),
-                        duet_enabled=item.get("duetEnabled"),
-                        duet_from_id=item.get("duetInfo", {}).get("duetFromId"),
-                        is_ad=item.get("isAd"),
-                        can_repost=item.get("item_control", {}).get("can_repost"),
-                        author_id=author_data.get("id"),
-                        music_id=music_data.get("id"),
-                        url=f"https://www.tiktok.com/@{author_data.get('uniqueId')}/video/{item.get('id')}",
-                        session=s,
+                    await insert_music_batch(rows["music"], session=s)
+                    await insert_post_batch(rows["posts"], session=s)
+                    await insert_post_stats_batch(rows["posts_reporting"], session=s)
+                    await insert_or_update_challenge_batch(
+                        rows["challenges"], session=s
                     )
-
-                    # Process Video Stats
-                    await insert_post_stats(
-                        id=item.get("id"),
-                        collected_at=datetime.fromisoformat(item.get("collected_at")),
-                        collect_count=item.get("statsV2", {}).get("collectCount"),
-                        comment_count=item.get("statsV2", {}).get("commentCount"),
-                        digg_count=item.get("statsV2", {}).get("diggCount"),
-                        play_count=item.get("statsV2", {}).get("playCount"),
-                        repost_count=item.get("statsV2", {}).get("repostCount"),
-                        share_count=item.get("statsV2", {}).get("shareCount"),
-                        url=f"https://www.tiktok.com/@{author_data.get('uniqueId')}/video/{item.get('id')}",
-                        session=s,
+                    await insert_post_challenge_batch(
+                        rows["posts_challenges"], session=s
                     )
 
-                    # Process Challenges
-                    for challenge_data in item.get("challenges", []):
-                        await insert_or_update_challenge(
-                            id=challenge_data.get("id"),
-                            title=challenge_data.get("title"),
-                            description=challenge_data.get("desc"),
-                            session=s,
-                        )
-
-                        await insert_post_challenge(
-                            post_id=item.get("id"),
-                            challenge_id=challenge_data.get("id"),
-                            session=s,
-                        )
-
                     logger.debug(
-                        f"Processed and stored TikTok data for video ID: {item.get('id', 'Unknown')}"
+                        f"Processed and stored TikTok data for video IDs: "
+                        f"{[item.get('id', 'Unknown') for item in items]}"
                     )
 
                 except Exception as e:
                     logger.error(
-                        f"Error in transaction while processing TikTok item, rolling back: {e}"
+                        f"Error in transaction while processing TikTok items, rolling back: {e}"
                     )
                     await s.rollback()
                     raise
@@ -4,11 +4,13 @@ import os
 import sys
 
 import aio_pika
-from sqlalchemy import func, select
+from pgvector.asyncpg import register_vector
+from sqlalchemy import delete, event, literal
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import configure_mappers, sessionmaker
+from sqlalchemy.types import NullType
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
@@ -16,12 +18,23 @@ sys.path.append(parent_dir)
 
 from dotenv import load_dotenv
 
+from helpers.embedding_codec import CONTENT_TYPE, decode_embeddings
 from helpers.rabbitmq import RabbitMQClient
-from postgresql.database_models.video_embeddings import VideoEmbeddings
+from postgresql.database_models.video_embeddings import (
+    DESCRIPTION_ELEMENT,
+    FRAME_ELEMENT,
+    VideoEmbeddings,
+)
+from postgresql.database_scripts.video_fingerprints import mark_video_embedded
 
 load_dotenv()
 
 
+def register_vector_codecs(dbapi_connection, connection_record):
+    # Embeddings are sent to the database in the binary format of pgvector
+    dbapi_connection.run_async(register_vector)
+
+
 class EmbeddingsConsumer(RabbitMQClient):
     def __init__(self, rabbitmq_server, rabbitmq_port, user, password):
         super().__init__(rabbitmq_server, rabbitmq_port, user, password)
@@ -32,6 +45,7 @@ class EmbeddingsConsumer(RabbitMQClient):
         # Initialize database connection using env variables
         db_url = f"postgresql+asyncpg://{os.environ.get('POSTGRES_USER')}:{os.environ.get('POSTGRES_PASSWORD')}@{os.environ.get('POSTGRES_HOST')}:{os.environ.get('POSTGRES_PORT')}/{os.environ.get('POSTGRES_DB')}"
         self.engine = create_async_engine(db_url, echo=True)
+        event.listen(self.engine.sync_engine, "connect", register_vector_codecs)
         self.async_session = sessionmaker(
             self.engine, class_=AsyncSession, expire_on_commit=False
         )
@@ -69,60 +83,97 @@ class EmbeddingsConsumer(RabbitMQClient):
             print(f"Error initializing EmbeddingsConsumer: {str(e)}")
             raise
 
-    async def get_next_element_id(self, session, post_id):
-        # This function gets the highest video embeddings id that exists in the DB, otherwise returns 0
-        """Get the next available element_id for a given post_id"""
-        result = await session.execute(
-            select(func.coalesce(func.max(VideoEmbeddings.element_id), 0)).where(
-                VideoEmbeddings.post_id == post_id
+    async def store_embeddings(
+        self,
+        session,
+        post_id,
+        frames,
+        description=None,
+        content_sha256=None,
+        embedded=None,
+    ):
+        """
+        Store the embeddings of a video with one insert and one commit
+
+        The description is stored at element_id 0 and the key frames from element_id 1
+        on, in their order in the video, so a redelivered or reprocessed video
+        overwrites its rows instead of adding new ones.
+
+        Parameters:
+        - session: AsyncSession: The database session
+        - post_id: str: The id of the post
+        - frames: np.ndarray: The key frame embeddings, one per row, or a list of them
+        - description: np.ndarray: The description embedding, None if there is none
+        - content_sha256: str: The SHA-256 of the video, marked as embedded if given
+          and every key frame is embedded
+        - embedded: np.ndarray: One boolean per key frame, True if its embedding is in
+          frames, None if every key frame is
+        """
+        if embedded is None:
+            embedded = [True] * len(frames)
+        # Key frames that failed to embed leave their element_id empty
+        element_ids = [
+            position for position, done in enumerate(embedded, start=1) if done
+        ]
+
+        # The arrays are bound as they are, without the text conversion of the
+        # column type, and encoded by the binary codec of the connection
+        rows = [
+            {
+                "post_id": post_id,
+                "element_id": element_id,
+                "element_type": FRAME_ELEMENT,
+                "embedding": literal(embedding, NullType()),
+            }
+            for element_id, embedding in zip(element_ids, frames)
+        ]
+        if description is not None:
+            rows.append(
+                {
+                    "post_id": post_id,
+                    "element_id": 0,
+                    "element_type": DESCRIPTION_ELEMENT,
+                    "embedding": literal(description, NullType()),
+                }
             )
-        )
-        max_element_id = result.scalar()
-        return max_element_id + 1
 
-    async def process_tiktok_item(self, session, item, post_id):
         try:
-            # Get the next available element_id
-            element_id = await self.get_next_element_id(session, post_id)
-
-            embedding = item
-
-            # if (element_id == 1):
-            #     # if the next element ID is one, store the description first
-            #     embedding = item[1]
-            # else:
-            #     # Store the video embedding
-            #     embedding = item[0]
-
-            print(
-                f"Processing embedding for post_id: {post_id}, element_id: {element_id}"
-            )
-
-            stmt = (
-                insert(VideoEmbeddings)
-                .values(
-                    post_id=post_id,
-                    element_id=element_id,
-                    embedding=embedding,
+            if rows:
+                stmt = insert(VideoEmbeddings).values(rows)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["post_id", "element_id"],
+                    set_={
+                        "embedding": stmt.excluded.embedding,
+                        "element_type": stmt.excluded.element_type,
+                    },
                 )
-                .on_conflict_do_update(
-                    index_elements=[
-                        "post_id",
-                        "element_id",
-                    ],  # As it is Composite primary key
-                    set_={"embedding": embedding},
+                await session.execute(stmt)
+
+            if len(embedded):
+                # Key frames left from an earlier version of the video
+                await session.execute(
+                    delete(VideoEmbeddings).where(
+                        VideoEmbeddings.post_id == post_id,
+                        VideoEmbeddings.element_type == FRAME_ELEMENT,
+                        VideoEmbeddings.element_id > len(embedded),
+                    )
                 )
-            )
 
-            await session.execute(stmt)
+            # Later collection rounds skip videos that are already embedded, a
+            # video missing key frames is embedded again
+            if content_sha256 and all(embedded):
+                await mark_video_embedded(post_id, content_sha256, session)
             await session.commit()
-            print(f"Inserted embedding for post {post_id} with element_id {element_id}")
+            print(
+                f"Stored {len(frames)} frame embeddings for post {post_id}"
+                f"{' and its description' if description is not None else ''}"
+            )
 
         except IntegrityError as e:
             print(f"Integrity error processing message for post {post_id}: {e}")
             await session.rollback()
         except Exception as e:
-            print(f"Error processing TikTok item: {e}")
+            print(f"Error storing embeddings: {e}")
             await session.rollback()
             raise
 
@@ -137,21 +188,42 @@ class EmbeddingsConsumer(RabbitMQClient):
         except Exception as e:
             print(f"Error consuming messages: {e}")
 
+    def read_embeddings(self, message: aio_pika.IncomingMessage):
+        """
+        Read the frame and description embeddings of a message
+
+        Returns:
+        - frames: The key frame embeddings
+        - description: The description embedding, None if there is none
+        - embedded: One boolean per key frame, True if its embedding is in frames,
+          None if every key frame is
+        """
+        if message.content_type == CONTENT_TYPE:
+            return decode_embeddings(message.body)
+
+        # Messages published before the binary format are JSON, and before
+        # description embeddings a list of frames
+        body = json.loads(message.body)
+        if isinstance(body, list):
+            return body, None, None
+        return body.get("frames") or [], body.get("description"), None
+
     async def process_message(self, message: aio_pika.IncomingMessage):
         try:
             async with message.process():
                 post_id = message.routing_key.split(".")[-1]
-                tiktok_data = json.loads(message.body)
+                frames, description, embedded = self.read_embeddings(message)
+                print(f"Received {len(frames)} frame embeddings")
 
                 async with self.async_session() as session:
-                    if isinstance(tiktok_data, list):
-                        print(
-                            f"Received a list of {len(tiktok_data)} TikTok data items"
-                        )
-                        for item in tiktok_data:
-                            await self.process_tiktok_item(session, item, post_id)
-                    else:
-                        await self.process_tiktok_item(session, tiktok_data, post_id)
+                    await self.store_embeddings(
+                        session,
+                        post_id,
+                        frames,
+                        description,
+                        (message.headers or {}).get("content_sha256"),
+                        embedded,
+                    )
         except Exception as e:
             print(f"Error processing message: {e}")
 
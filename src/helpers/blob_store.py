@@ -0,0 +1,258 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+
+
+class LocalBlobStore:
+    """
+    Content-addressed blob store in a local directory
+
+    Blobs are stored under the SHA-256 of their content, so storing the same video twice
+    keeps a single copy. Services pass the hash around instead of the content.
+
+    Example Usage:
+        store = LocalBlobStore("/app/blobs")
+        ref = await store.put_stream(chunks)
+        data = store.read_bytes(ref["sha256"])
+    """
+
+    def __init__(self, root, chunk_size=256 * 1024):
+        self.root = root
+        self.chunk_size = chunk_size
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+
+    def path(self, sha256):
+        """
+        Returns the path of a blob, blobs are spread over subdirectories by hash prefix
+        """
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256):
+        return os.path.exists(self.path(sha256))
+
+    async def put_stream(self, chunks):
+        """
+        Store a blob from an async iterator of chunks, without holding it in memory
+
+        Parameters:
+        - chunks: AsyncIterator[bytes]: The content of the blob
+
+        Returns:
+        - dict: Reference to the blob with its sha256 and size
+        """
+        digest = hashlib.sha256()
+        size = 0
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+
+            sha256 = digest.hexdigest()
+            await asyncio.to_thread(self._commit, tmp_path, sha256)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return {"sha256": sha256, "size": size}
+
+    def put_bytes(self, data):
+        """
+        Store a blob from bytes
+
+        Returns:
+        - dict: Reference to the blob with its sha256 and size
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.path(sha256)
+        if os.path.exists(path):
+            # Stored again, it must outlive the messages referencing it now
+            os.utime(path)
+        else:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            self._commit(tmp_path, sha256)
+
+        return {"sha256": sha256, "size": len(data)}
+
+    def _commit(self, tmp_path, sha256):
+        path = self.path(sha256)
+        if os.path.exists(path):
+            # Same content is already stored, prune keeps it as long as a new one
+            os.remove(tmp_path)
+            os.utime(path)
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+    def open(self, sha256):
+        """
+        Open a blob for reading
+
+        Raises:
+        - FileNotFoundError: If the blob doesn't exist
+        """
+        return open(self.path(sha256), "rb")
+
+    def read_bytes(self, sha256):
+        with self.open(sha256) as f:
+            return f.read()
+
+    async def stream(self, sha256):
+        """
+        Yields the content of a blob in chunks
+        """
+        with self.open(sha256) as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, self.chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def delete(self, sha256):
+        if self.exists(sha256):
+            os.remove(self.path(sha256))
+
+    def prune(self, max_age):
+        """
+        Delete blobs that were not modified in the last max_age seconds
+
+        Returns:
+        - int: The number of deleted blobs
+        """
+        deleted = 0
+        cutoff = time.time() - max_age
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        deleted += 1
+                except FileNotFoundError:
+                    pass
+        return deleted
+
+
+class S3BlobStore(LocalBlobStore):
+    """
+    Content-addressed blob store in an S3-compatible bucket (e.g. MinIO)
+
+    The local directory is used as a cache in front of the bucket, so services on the
+    same host don't download a blob more than once. prune deletes old blobs from both,
+    a blob stored again is copied onto itself to refresh its age. Requires boto3.
+    """
+
+    def __init__(self, root, bucket, endpoint_url=None, chunk_size=256 * 1024):
+        super().__init__(root, chunk_size=chunk_size)
+
+        import boto3
+
+        self.bucket = bucket
+        self.s3 = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _remote_exists(self, sha256):
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=sha256)
+            return True
+        except self.s3.exceptions.ClientError:
+            return False
+
+    def _upload(self, sha256):
+        if self._remote_exists(sha256):
+            # Refresh LastModified, prune deletes blobs by it
+            self.s3.copy_object(
+                Bucket=self.bucket,
+                Key=sha256,
+                CopySource={"Bucket": self.bucket, "Key": sha256},
+                MetadataDirective="REPLACE",
+            )
+        else:
+            self.s3.upload_file(self.path(sha256), self.bucket, sha256)
+
+    def _download(self, sha256):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        os.close(fd)
+        try:
+            self.s3.download_file(self.bucket, sha256, tmp_path)
+        except self.s3.exceptions.ClientError:
+            os.remove(tmp_path)
+            raise FileNotFoundError(f"Blob {sha256} not found in {self.bucket}")
+        self._commit(tmp_path, sha256)
+
+    def exists(self, sha256):
+        return super().exists(sha256) or self._remote_exists(sha256)
+
+    async def put_stream(self, chunks):
+        ref = await super().put_stream(chunks)
+        await asyncio.to_thread(self._upload, ref["sha256"])
+        return ref
+
+    def put_bytes(self, data):
+        ref = super().put_bytes(data)
+        self._upload(ref["sha256"])
+        return ref
+
+    def open(self, sha256):
+        if not os.path.exists(self.path(sha256)):
+            self._download(sha256)
+        return super().open(sha256)
+
+    def delete(self, sha256):
+        super().delete(sha256)
+        self.s3.delete_object(Bucket=self.bucket, Key=sha256)
+
+    def prune(self, max_age):
+        """
+        Delete blobs that were not stored in the last max_age seconds from the bucket
+        and from the local cache
+
+        Returns:
+        - int: The number of blobs deleted from the bucket
+        """
+        super().prune(max_age)
+
+        cutoff = time.time() - max_age
+        deleted = 0
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket):
+            # A page holds at most 1000 objects, as many as a delete request takes
+            expired = [
+                {"Key": blob["Key"]}
+                for blob in page.get("Contents", [])
+                if blob["LastModified"].timestamp() < cutoff
+            ]
+            if expired:
+                self.s3.delete_objects(
+                    Bucket=self.bucket, Delete={"Objects": expired, "Quiet": True}
+                )
+                deleted += len(expired)
+        return deleted
+
+
+def get_blob_store():
+    """
+    Create the blob store configured by the environment
+
+    - BLOB_STORE_PATH: Local directory of the store, or its cache when S3 is used
+    - BLOB_STORE_S3_BUCKET: Store blobs in this bucket instead of only locally
+    - BLOB_STORE_S3_ENDPOINT: Endpoint of an S3-compatible server
+    """
+    root = os.environ.get("BLOB_STORE_PATH") or "blobs"
+    bucket = os.environ.get("BLOB_STORE_S3_BUCKET")
+
+    if bucket:
+        return S3BlobStore(
+            root,
+            bucket=bucket,
+            endpoint_url=os.environ.get("BLOB_STORE_S3_ENDPOINT") or None,
+        )
+    return LocalBlobStore(root)
@@ -0,0 +1,113 @@
+import struct
+
+import numpy as np
+
+# Content type of the messages carrying embeddings in the binary format
+CONTENT_TYPE = "application/x-embeddings"
+
+# Little-endian header: magic, version, dtype code, flags, number of frames and
+# dimension. It takes 16 bytes so the arrays after it stay aligned.
+HEADER = struct.Struct("<4sBBHII")
+MAGIC = b"EMBS"
+VERSION = 1
+
+DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+DTYPE_CODES = {"float32": 1, "float16": 2}
+
+# Flag set when the description embedding comes before the frames
+HAS_DESCRIPTION = 1
+# Flag set when some key frames have no embedding. A byte per key frame, 1 if its
+# embedding is in the message, follows the header, padded to keep the arrays aligned.
+HAS_MASK = 2
+
+
+def encode_embeddings(frames, description=None, dtype="float32"):
+    """
+    Encode the embeddings of a video as little-endian arrays after a small header
+
+    A 1408 dimension embedding takes 5.6 KB as float32 and 2.8 KB as float16, instead
+    of about 25 KB of JSON. Key frames that couldn't be embedded keep their position,
+    the others aren't shifted.
+
+    Parameters:
+    - frames: list: The key frame embeddings, None for the key frames not embedded
+    - description: list: The description embedding, None if there is none
+    - dtype: str: float32, or float16 for half the size and precision
+
+    Returns:
+    - bytes: The encoded embeddings
+
+    Example Usage:
+        body = encode_embeddings(frame_embeddings, description_embedding, "float16")
+        frames, description, embedded = decode_embeddings(body)
+    """
+    code = DTYPE_CODES[dtype]
+    mask = np.array([frame is not None for frame in frames], dtype=np.uint8)
+    embeddings = [frame for frame in frames if frame is not None]
+    flags = 0
+    if description is not None:
+        embeddings.insert(0, description)
+        flags |= HAS_DESCRIPTION
+
+    array = np.asarray(embeddings, dtype=DTYPES[code])
+    if not embeddings:
+        array = array.reshape(0, 0)
+
+    prefix = b""
+    if not mask.all():
+        flags |= HAS_MASK
+        prefix = mask.tobytes().ljust(mask_size(len(mask)), b"\0")
+
+    header = HEADER.pack(MAGIC, VERSION, code, flags, len(mask), array.shape[1])
+    return header + prefix + array.tobytes()
+
+
+def mask_size(count):
+    # Rounded up to 4 bytes, the alignment of float32
+    return -(-count // 4) * 4
+
+
+def decode_embeddings(body):
+    """
+    Decode embeddings encoded by encode_embeddings
+
+    The arrays are read-only views of the body, nothing is copied.
+
+    Returns:
+    - frames: np.ndarray: The key frame embeddings, one per row
+    - description: np.ndarray: The description embedding, None if there is none
+    - embedded: np.ndarray: One boolean per key frame, True if its embedding is in
+      frames. The embedding of the i-th True key frame is the i-th row of frames.
+
+    Raises:
+    - ValueError: If the body isn't encoded embeddings
+    """
+    if len(body) < HEADER.size:
+        raise ValueError("Embeddings message is shorter than its header")
+
+    magic, version, code, flags, count, dimension = HEADER.unpack_from(body)
+    if magic != MAGIC or version != VERSION or code not in DTYPES:
+        raise ValueError("Unsupported embeddings message format")
+
+    offset = HEADER.size
+    if flags & HAS_MASK:
+        if len(body) < offset + mask_size(count):
+            raise ValueError("Embeddings message is shorter than its mask")
+        embedded = np.frombuffer(body, dtype=np.uint8, count=count, offset=offset)
+        embedded = embedded.astype(bool)
+        offset += mask_size(count)
+    else:
+        embedded = np.ones(count, dtype=bool)
+
+    rows = int(embedded.sum()) + (1 if flags & HAS_DESCRIPTION else 0)
+    dtype = DTYPES[code]
+    if len(body) != offset + rows * dimension * dtype.itemsize:
+        raise ValueError("Embeddings message size doesn't match its header")
+
+    array = np.frombuffer(
+        body, dtype=dtype, count=rows * dimension, offset=offset
+    ).reshape(rows, dimension)
+
+    if flags & HAS_DESCRIPTION:
+        return array[1:], array[0], embedded
+    return array, None, embedded
@@ -0,0 +1,655 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+# Dimension of the video_embeddings vectors, every provider returns embeddings of it
+EMBEDDING_DIMENSION = 1408
+
+
+class EmbeddingProvider(ABC):
+    """
+    Interface of the models embedding frames, images and texts in the same space
+
+    The methods are blocking and safe to call from several threads. Embeddings of
+    different providers are not comparable, video_embeddings must be filled and
+    searched with the same provider.
+    """
+
+    # Frames embedded by one call of embed_frames
+    batch_size = 1
+    # Whether calls count against an API quota and have to be rate limited
+    rate_limited = False
+    # Errors after which a call is worth retrying
+    retryable_errors = ()
+
+    @abstractmethod
+    def embed_frames(self, frames):
+        """
+        Parameters:
+        - frames: list: BGR frames, at most batch_size of them
+
+        Returns:
+        - list: The embedding of every frame
+        """
+
+    @abstractmethod
+    def embed_image(self, image_bytes):
+        """
+        Returns:
+        - list: The embedding of an encoded image (JPEG or PNG)
+        """
+
+    @abstractmethod
+    def embed_text(self, text):
+        """
+        Returns:
+        - list: The embedding of a text
+        """
+
+
+class VertexEmbeddingProvider(EmbeddingProvider):
+    """
+    Vertex AI multimodal embedding model, set up once and reused for every call
+
+    The credentials, the vertexai initialization and the model handle are created on
+    the first call and shared by all threads of the process. Images are sent as encoded
+    bytes, nothing is written to disk. Requires google-cloud-aiplatform.
+
+    Example Usage:
+        provider = VertexEmbeddingProvider(project_id, region)
+        image_embedding = provider.embed_frame(frame)
+        text_embedding = provider.embed_text("cats")
+    """
+
+    rate_limited = True
+
+    def __init__(
+        self,
+        project_id=None,
+        region=None,
+        credentials_path=None,
+        model_name="multimodalembedding@001",
+        dimension=EMBEDDING_DIMENSION,
+    ):
+        """
+        Parameters:
+        - project_id: str: Google Cloud project, the default of the environment if None
+        - region: str: Google Cloud region, the default of the environment if None
+        - credentials_path: str: Service account file, application default credentials
+          are used if None
+        - model_name: str: The embedding model
+        - dimension: int: Dimension of the returned embeddings
+        """
+        from google.api_core import exceptions
+
+        self.project_id = project_id
+        self.region = region
+        self.credentials_path = credentials_path
+        self.model_name = model_name
+        self.dimension = dimension
+        self._model = None
+        self._lock = threading.Lock()
+
+        # The quota was exceeded or the service is briefly unavailable
+        self.retryable_errors = (
+            exceptions.TooManyRequests,
+            exceptions.ResourceExhausted,
+            exceptions.ServiceUnavailable,
+            exceptions.InternalServerError,
+            exceptions.DeadlineExceeded,
+        )
+
+    def load(self):
+        """
+        Returns the model handle, creating it on the first call
+
+        Raises:
+        - FileNotFoundError: If the credentials file doesn't exist
+        """
+        if self._model is not None:
+            return self._model
+
+        with self._lock:
+            if self._model is None:
+                import vertexai
+                from google.oauth2 import service_account
+                from vertexai.vision_models import MultiModalEmbeddingModel
+
+                credentials = None
+                if self.credentials_path:
+                    if not os.path.exists(self.credentials_path):
+                        raise FileNotFoundError("Google credentials file not found")
+                    credentials = service_account.Credentials.from_service_account_file(
+                        self.credentials_path
+                    )
+
+                vertexai.init(
+                    project=self.project_id,
+                    location=self.region,
+                    credentials=credentials,
+                )
+                self._model = MultiModalEmbeddingModel.from_pretrained(self.model_name)
+        return self._model
+
+    def embed(self, image_bytes=None, contextual_text=None):
+        """
+        Embed an image and/or a text in a single request
+
+        Parameters:
+        - image_bytes: bytes: Encoded image (JPEG or PNG)
+        - contextual_text: str: Text to embed
+
+        Returns:
+        - tuple: The image embedding and the text embedding, None if not requested
+        """
+        return self._embed(image_bytes, contextual_text)
+
+    def _embed(self, image_bytes, contextual_text, encode_time=0.0):
+        from vertexai.vision_models import Image
+
+        start = time.perf_counter()
+        model = self.load()
+        loaded = time.perf_counter()
+
+        embeddings = model.get_embeddings(
+            image=Image(image_bytes=image_bytes) if image_bytes else None,
+            contextual_text=contextual_text,
+            dimension=self.dimension,
+        )
+        done = time.perf_counter()
+
+        print(
+            f"Embedding took {(encode_time + done - start) * 1000:.0f} ms "
+            f"(encode {encode_time * 1000:.0f} ms, "
+            f"setup {(loaded - start) * 1000:.0f} ms, "
+            f"request {(done - loaded) * 1000:.0f} ms)"
+        )
+        return embeddings.image_embedding, embeddings.text_embedding
+
+    def embed_frame(self, frame):
+        """
+        Embed a BGR frame, encoded to JPEG in memory. Requires OpenCV.
+
+        Returns:
+        - list: The image embedding
+        """
+        import cv2
+
+        start = time.perf_counter()
+        success, encoded = cv2.imencode(".jpg", frame)
+        if not success:
+            raise ValueError("Could not encode the frame to JPEG")
+
+        image_embedding, _ = self._embed(
+            encoded.tobytes(), None, encode_time=time.perf_counter() - start
+        )
+        return image_embedding
+
+    def embed_frames(self, frames):
+        # The API embeds one image per request
+        return [self.embed_frame(frame) for frame in frames]
+
+    def embed_image(self, image_bytes):
+        image_embedding, _ = self.embed(image_bytes=image_bytes)
+        return image_embedding
+
+    def embed_text(self, text):
+        _, text_embedding = self.embed(contextual_text=text)
+        return text_embedding
+
+
+class ClipEmbeddingProvider(EmbeddingProvider):
+    """
+    CLIP model exported to ONNX, run on the CPU inside the process
+
+    The model directory holds vision_model.onnx, text_model.onnx and tokenizer.json, as
+    in the ONNX exports of openai/clip-vit-base-patch32. Frames are embedded in batches.
+    Embeddings are normalized and padded with zeros to EMBEDDING_DIMENSION, which
+    doesn't change their cosine similarities, so they fit in video_embeddings.
+
+    Requires onnxruntime, tokenizers and OpenCV.
+
+    Example Usage:
+        provider = ClipEmbeddingProvider("models/clip")
+        image_embeddings = provider.embed_frames(frames)
+    """
+
+    # Normalization of the pixel values the model was trained with, in RGB order
+    MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32)
+    STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32)
+
+    def __init__(
+        self,
+        model_dir,
+        batch_size=16,
+        image_size=224,
+        context_length=77,
+        dimension=EMBEDDING_DIMENSION,
+    ):
+        """
+        Parameters:
+        - model_dir: str: Directory of the ONNX models and the tokenizer
+        - batch_size: int: Frames embedded by one inference
+        - image_size: int: Side of the square images the model takes
+        - context_length: int: Maximum number of tokens of a text
+        - dimension: int: Dimension the embeddings are padded to
+        """
+        self.model_dir = model_dir
+        self.batch_size = batch_size
+        self.image_size = image_size
+        self.context_length = context_length
+        self.dimension = dimension
+        self._sessions = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Returns the vision session, the text session and the tokenizer, loading them on
+        the first call
+        """
+        if self._sessions is not None:
+            return self._sessions
+
+        with self._lock:
+            if self._sessions is None:
+                import onnxruntime
+                from tokenizers import Tokenizer
+
+                options = onnxruntime.SessionOptions()
+                options.graph_optimization_level = (
+                    onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+                )
+                vision, text = (
+                    onnxruntime.InferenceSession(
+                        os.path.join(self.model_dir, name),
+                        options,
+                        providers=["CPUExecutionProvider"],
+                    )
+                    for name in ("vision_model.onnx", "text_model.onnx")
+                )
+                tokenizer = Tokenizer.from_file(
+                    os.path.join(self.model_dir, "tokenizer.json")
+                )
+                self._sessions = vision, text, tokenizer
+        return self._sessions
+
+    def preprocess(self, frame):
+        """
+        Resize the shortest side of a BGR frame to image_size, crop its center and
+        normalize it like the images the model was trained on
+
+        Returns:
+        - np.ndarray: The image, channels first
+        """
+        import cv2
+
+        height, width = frame.shape[:2]
+        scale = self.image_size / min(height, width)
+        resized = cv2.resize(
+            frame,
+            (
+                max(round(width * scale), self.image_size),
+                max(round(height * scale), self.image_size),
+            ),
+            interpolation=cv2.INTER_CUBIC,
+        )
+
+        top = (resized.shape[0] - self.image_size) // 2
+        left = (resized.shape[1] - self.image_size) // 2
+        crop = resized[top : top + self.image_size, left : left + self.image_size]
+
+        rgb = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB).astype(np.float32) / 255
+        return ((rgb - self.MEAN) / self.STD).transpose(2, 0, 1)
+
+    def run(self, session, inputs):
+        """
+        Run a session with the inputs it takes
+
+        Returns:
+        - np.ndarray: The projected embeddings of the batch
+        """
+        names = [i.name for i in session.get_inputs()]
+        outputs = session.run(None, {name: inputs[name] for name in names})
+
+        # Exports also return the hidden states, the embeddings come first or are named
+        output_names = [o.name for o in session.get_outputs()]
+        for name, output in zip(output_names, outputs):
+            if name.endswith("embeds"):
+                return output
+        return outputs[0]
+
+    def pad(self, embeddings):
+        """
+        Normalize the embeddings and pad them with zeros to the expected dimension
+
+        Returns:
+        - list: The embeddings as lists of floats
+        """
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        padded = np.zeros((len(embeddings), self.dimension), dtype=np.float32)
+        padded[:, : embeddings.shape[1]] = embeddings
+        return padded.tolist()
+
+    def embed_frames(self, frames):
+        vision, _, _ = self.load()
+
+        start = time.perf_counter()
+        pixel_values = np.stack([self.preprocess(frame) for frame in frames])
+        preprocessed = time.perf_counter()
+        embeddings = self.run(vision, {"pixel_values": pixel_values})
+        done = time.perf_counter()
+
+        print(
+            f"Embedded {len(frames)} frames in {(done - start) * 1000:.0f} ms "
+            f"(preprocess {(preprocessed - start) * 1000:.0f} ms, "
+            f"inference {(done - preprocessed) * 1000:.0f} ms)"
+        )
+        return self.pad(embeddings)
+
+    def embed_image(self, image_bytes):
+        import cv2
+
+        frame = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("Could not decode the image")
+        return self.embed_frames([frame])[0]
+
+    def embed_text(self, text):
+        _, session, tokenizer = self.load()
+
+        ids = tokenizer.encode(text).ids
+        if len(ids) > self.context_length:
+            # Keep the end of text token, the text embedding is read at its position
+            ids = ids[: self.context_length - 1] + ids[-1:]
+
+        input_ids = np.array([ids], dtype=np.int64)
+        embeddings = self.run(
+            session,
+            {"input_ids": input_ids, "attention_mask": np.ones_like(input_ids)},
+        )
+        return self.pad(embeddings)[0]
+
+
+class EmbeddingProjection:
+    """
+    Linear projection of embeddings to fewer dimensions, fitted by PCA on stored
+    embeddings
+
+    Stored embeddings and the embeddings of new frames and queries have to go through
+    the same projection to stay comparable. Projected embeddings are normalized, only
+    their cosine similarities are used.
+
+    Example Usage:
+        projection = EmbeddingProjection.fit(sample, 256)
+        projection.save("models/projection.npz")
+        reduced = EmbeddingProjection.load("models/projection.npz").project(embeddings)
+    """
+
+    def __init__(self, mean, components):
+        """
+        Parameters:
+        - mean: np.ndarray: Mean of the fitted embeddings
+        - components: np.ndarray: Principal axes, one row per projected dimension
+        """
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)
+
+    @property
+    def dimension(self):
+        return len(self.components)
+
+    @classmethod
+    def fit(cls, embeddings, dimension):
+        """
+        Parameters:
+        - embeddings: np.ndarray: Sample of embeddings, one per row
+        - dimension: int: Dimension of the projected embeddings
+
+        Returns:
+        - EmbeddingProjection: The projection keeping the most variance of the sample
+
+        Raises:
+        - ValueError: If the sample has fewer embeddings or dimensions than dimension
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if dimension > min(embeddings.shape):
+            raise ValueError(
+                f"Can't fit {dimension} dimensions on {embeddings.shape[0]} "
+                f"embeddings of {embeddings.shape[1]} dimensions"
+            )
+
+        mean = embeddings.mean(axis=0)
+        _, _, components = np.linalg.svd(embeddings - mean, full_matrices=False)
+        return cls(mean, components[:dimension])
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as projection:
+            return cls(projection["mean"], projection["components"])
+
+    def save(self, path):
+        np.savez(path, mean=self.mean, components=self.components)
+
+    def project(self, embeddings):
+        """
+        Returns:
+        - np.ndarray: The normalized projected embeddings, one per row
+        """
+        projected = (np.asarray(embeddings, dtype=np.float32) - self.mean) @ (
+            self.components.T
+        )
+        return projected / np.linalg.norm(projected, axis=-1, keepdims=True)
+
+
+class ProjectedEmbeddingProvider(EmbeddingProvider):
+    """
+    Projects the embeddings of another provider to fewer dimensions
+    """
+
+    def __init__(self, provider, projection):
+        """
+        Parameters:
+        - provider: EmbeddingProvider: The provider of the full embeddings
+        - projection: EmbeddingProjection: The projection of the stored embeddings
+        """
+        self.provider = provider
+        self.projection = projection
+        self.batch_size = provider.batch_size
+        self.rate_limited = provider.rate_limited
+        self.retryable_errors = provider.retryable_errors
+
+    def embed_frames(self, frames):
+        return self.projection.project(self.provider.embed_frames(frames)).tolist()
+
+    def embed_image(self, image_bytes):
+        return self.projection.project(self.provider.embed_image(image_bytes)).tolist()
+
+    def embed_text(self, text):
+        return self.projection.project(self.provider.embed_text(text)).tolist()
+
+
+def get_embedding_provider():
+    """
+    Create the embedding provider configured by the environment
+
+    - EMBEDDING_PROVIDER: vertex (default) or clip
+    - GOOGLE_PROJECT_ID, REGION, GOOGLE_APPLICATION_CREDENTIALS: Used by vertex
+    - CLIP_MODEL_DIR: Directory of the ONNX CLIP model, used by clip
+    - CLIP_BATCH_SIZE: Frames embedded by one inference, used by clip
+    - EMBEDDING_PROJECTION: Projection the stored embeddings were reduced with, if any
+    """
+    provider = os.environ.get("EMBEDDING_PROVIDER") or "vertex"
+
+    if provider == "vertex":
+        embedding_provider = VertexEmbeddingProvider(
+            project_id=os.environ.get("GOOGLE_PROJECT_ID"),
+            region=os.environ.get("REGION"),
+            credentials_path=os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"),
+        )
+    elif provider == "clip":
+        embedding_provider = ClipEmbeddingProvider(
+            os.environ.get("CLIP_MODEL_DIR") or "models/clip",
+            batch_size=int(os.environ.get("CLIP_BATCH_SIZE") or 16),
+        )
+    else:
+        raise ValueError(f"Unknown embedding provider: {provider}")
+
+    if projection_path := os.environ.get("EMBEDDING_PROJECTION"):
+        embedding_provider = ProjectedEmbeddingProvider(
+            embedding_provider, EmbeddingProjection.load(projection_path)
+        )
+    return embedding_provider
+
+
+class AsyncEmbeddingClient:
+    """
+    Sends embedding requests concurrently while keeping them under a rate limit
+
+    Frames of all concurrent embed_frames calls are gathered in batches of the
+    provider's batch size. A batch is sent once it is full, or max_wait seconds after
+    its first frame arrived, and its embeddings are handed back to the callers. Every
+    call takes a token from the rate limiter, if any, and failed calls are retried
+    with exponential backoff and jitter.
+
+    Example Usage:
+        client = AsyncEmbeddingClient(VertexEmbeddingProvider(), TokenBucket(2, 2))
+        embeddings = await client.embed_frames(frames)
+    """
+
+    def __init__(
+        self,
+        provider,
+        limiter=None,
+        concurrency=8,
+        max_retries=5,
+        backoff=1.0,
+        max_backoff=60,
+        max_wait=0.05,
+    ):
+        """
+        Parameters:
+        - provider: EmbeddingProvider: The model, called from worker threads
+        - limiter: TokenBucket: The rate limiter, one token per call, None for no limit
+        - concurrency: int: Calls in flight at the same time
+        - max_retries: int: Times a failed call is retried
+        - backoff: float: Seconds waited before the first retry, doubled every retry
+        - max_backoff: float: Maximum seconds waited before a retry
+        - max_wait: float: Seconds a frame waits for its batch to fill up
+        """
+        self.provider = provider
+        self.limiter = limiter
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_wait = max_wait
+
+        # Frames waiting for their batch, with the futures of their embeddings
+        self.pending = []
+        self.flush_timer = None
+        self.batch_tasks = set()
+
+    async def call(self, method, *args):
+        """
+        Call a blocking method of the provider under the rate limit, with retries
+        """
+        attempt = 0
+        async with self.semaphore:
+            while True:
+                if self.limiter:
+                    await self.limiter.acquire()
+                try:
+                    return await asyncio.to_thread(method, *args)
+                except self.provider.retryable_errors as e:
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        raise
+
+                    delay = random.uniform(
+                        0, min(self.max_backoff, self.backoff * 2**attempt)
+                    )
+                    print(
+                        f"Embedding request failed ({e}), retrying in {delay:.1f}s "
+                        f"({attempt}/{self.max_retries})"
+                    )
+                    await asyncio.sleep(delay)
+
+    async def embed_text(self, text):
+        return await self.call(self.provider.embed_text, text)
+
+    async def embed_frames(self, frames):
+        """
+        Embed frames in batches shared with the other calls
+
+        Returns:
+        - list: The image embeddings, in the order of the frames, None for the frames
+          that can't be embedded
+        """
+        loop = asyncio.get_running_loop()
+
+        futures = []
+        for frame in frames:
+            future = loop.create_future()
+            self.pending.append((frame, future))
+            futures.append(future)
+            if len(self.pending) >= self.provider.batch_size:
+                self.flush()
+
+        if self.pending and self.flush_timer is None:
+            self.flush_timer = loop.call_later(self.max_wait, self.flush)
+
+        results = await asyncio.gather(*futures, return_exceptions=True)
+
+        embeddings = []
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Error generating embeddings: {result}")
+                embeddings.append(None)
+            else:
+                embeddings.append(result)
+        return embeddings
+
+    def flush(self):
+        """
+        Send the pending frames in batches
+        """
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+
+        size = self.provider.batch_size
+        while self.pending:
+            batch, self.pending = self.pending[:size], self.pending[size:]
+            task = asyncio.create_task(self.embed_batch(batch))
+            self.batch_tasks.add(task)
+            task.add_done_callback(self.batch_tasks.discard)
+
+    async def embed_batch(self, batch):
+        """
+        Embed a batch of frames and resolve the futures of their embeddings
+        """
+        try:
+            embeddings = await self.call(
+                self.provider.embed_frames, [frame for frame, _ in batch]
+            )
+        except Exception as e:
+            if len(batch) > 1:
+                # Embed the frames one by one, so a bad frame doesn't fail the others
+                print(f"Error embedding a batch of {len(batch)} frames: {e}")
+                for item in batch:
+                    await self.embed_batch([item])
+                return
+
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
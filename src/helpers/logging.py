@@ -1,8 +1,15 @@
 from loguru import logger
 
+# Sinks already added, by log name
+sinks = {}
+
 
 def setup_logger(log_name, level="INFO"):
-    logger.add(
+    # Modules of the same service log to the same file, its sink is added once
+    if log_name in sinks:
+        return logger
+
+    sinks[log_name] = logger.add(
         f"logs/{log_name}.log",
         level=level,
         format="{time} | {level} | {module}:{function}:{line} | {message}",
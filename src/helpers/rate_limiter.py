@@ -0,0 +1,104 @@
+import asyncio
+import os
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter shared by the tasks of a process
+
+    The bucket holds at most capacity tokens and is refilled at rate tokens per second.
+    Every call takes a token, calls wait in order until one is available.
+
+    Example Usage:
+        limiter = TokenBucket(rate=2, capacity=2)
+        await limiter.acquire()
+    """
+
+    def __init__(self, rate, capacity):
+        """
+        Parameters:
+        - rate: float: Tokens added per second
+        - capacity: float: Maximum number of tokens, the largest burst of calls
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def take(self, tokens):
+        """
+        Take tokens if the bucket has enough of them
+
+        Returns:
+        - float: 0 if the tokens were taken, otherwise the seconds to wait
+        """
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    async def acquire(self, tokens=1):
+        """
+        Wait until the tokens are taken
+        """
+        async with self._lock:
+            while (wait := await self.take(tokens)) > 0:
+                await asyncio.sleep(wait)
+
+
+class PostgresTokenBucket(TokenBucket):
+    """
+    Token bucket stored in the rate_limits table, shared by every replica using the
+    same name, so together they stay under a quota of the API they call
+
+    Tasks of the same process still wait in order locally, only one of them polls the
+    database at a time. Requires the postgresql package and its configuration.
+    """
+
+    def __init__(self, name, rate, capacity):
+        super().__init__(rate, capacity)
+
+        from postgresql.config.db import session
+        from postgresql.database_scripts.rate_limits import take_tokens
+
+        self.name = name
+        self.session = session
+        self.take_tokens = take_tokens
+
+    async def take(self, tokens):
+        async with self.session() as s:
+            wait = await self.take_tokens(
+                self.name, tokens, self.rate, self.capacity, s
+            )
+            await s.commit()
+        return wait
+
+
+def get_rate_limiter(name, calls_per_minute):
+    """
+    Create the rate limiter configured by the environment
+
+    - RATE_LIMITER_BACKEND: local (default) limits each process on its own, postgres
+      shares the limit between all replicas through the database
+
+    Parameters:
+    - name: str: Name of the limit, replicas using the same name share it
+    - calls_per_minute: float: Calls allowed per minute
+
+    Returns:
+    - TokenBucket: The rate limiter, allowing bursts of one second worth of calls
+    """
+    rate = calls_per_minute / 60
+    capacity = max(1.0, rate)
+
+    if (os.environ.get("RATE_LIMITER_BACKEND") or "local") == "postgres":
+        return PostgresTokenBucket(name, rate, capacity)
+    return TokenBucket(rate, capacity)
@@ -0,0 +1,41 @@
+"""Video fingerprints table
+
+Revision ID: 5e2f8c1d9a47
+Revises: 0a679bf06c73
+Create Date: 2026-10-18 09:12:41.518203
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5e2f8c1d9a47"
+down_revision: Union[str, None] = "0a679bf06c73"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "video_fingerprints",
+        sa.Column("post_id", sa.String(), nullable=False),
+        sa.Column("content_sha256", sa.String(), nullable=False),
+        sa.Column(
+            "published_at",
+            sa.DateTime(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("embedded_at", sa.DateTime(), nullable=True),
+        sa.Column(
+            "inserted_at", sa.DateTime(), server_default=sa.text("now()"), nullable=True
+        ),
+        sa.PrimaryKeyConstraint("post_id", "content_sha256"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("video_fingerprints")
@@ -0,0 +1,234 @@
+"""BIGINT posts_reporting counters
+
+Revision ID: 8d3b6f0e2c15
+Revises: 5e2f8c1d9a47
+Create Date: 2026-10-18 10:41:07.262915
+
+"""
+
+from datetime import datetime
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8d3b6f0e2c15"
+down_revision: Union[str, None] = "5e2f8c1d9a47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNTERS = [
+    "collect_count",
+    "comment_count",
+    "digg_count",
+    "play_count",
+    "repost_count",
+    "share_count",
+]
+
+# Rows converted per transaction, so the table is never locked for long
+BACKFILL_BATCH_SIZE = 10000
+
+
+def post_trends_view(current_views: str, where: str) -> str:
+    return f"""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS post_trends AS
+        WITH time_period_changes AS (
+            SELECT
+                id as post_id,
+                collected_at,
+                {current_views} as current_views,
+                LAG({current_views}) OVER (
+                    PARTITION BY id
+                    ORDER BY collected_at
+                    RANGE BETWEEN INTERVAL '1 day' PRECEDING AND CURRENT ROW
+                ) as day_ago_views,
+                LAG({current_views}) OVER (
+                    PARTITION BY id
+                    ORDER BY collected_at
+                    RANGE BETWEEN INTERVAL '7 days' PRECEDING AND CURRENT ROW
+                ) as week_ago_views,
+                LAG({current_views}) OVER (
+                    PARTITION BY id
+                    ORDER BY collected_at
+                    RANGE BETWEEN INTERVAL '30 days' PRECEDING AND CURRENT ROW
+                ) as month_ago_views
+            FROM posts_reporting
+            WHERE {where}
+        )
+        SELECT
+            post_id,
+            collected_at,
+            current_views,
+            COALESCE(current_views - day_ago_views, 0) as daily_change,
+            COALESCE(current_views - week_ago_views, 0) as weekly_change,
+            COALESCE(current_views - month_ago_views, 0) as monthly_change,
+            CASE
+                WHEN day_ago_views > 0 THEN
+                    ((current_views - day_ago_views)::numeric / day_ago_views * 100)::numeric(10,2)
+                ELSE 0
+            END as daily_growth_rate,
+            CASE
+                WHEN week_ago_views > 0 THEN
+                    ((current_views - week_ago_views)::numeric / week_ago_views * 100)::numeric(10,2)
+                ELSE 0
+            END as weekly_growth_rate,
+            CASE
+                WHEN month_ago_views > 0 THEN
+                    ((current_views - month_ago_views)::numeric / month_ago_views * 100)::numeric(10,2)
+                ELSE 0
+            END as monthly_growth_rate
+        FROM time_period_changes
+    """
+
+
+CHALLENGE_TRENDS_VIEW = """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS challenge_trends AS
+    WITH latest_trends AS (
+        SELECT
+            post_id,
+            daily_growth_rate,
+            weekly_growth_rate,
+            monthly_growth_rate,
+            collected_at,
+            ROW_NUMBER() OVER (
+                PARTITION BY post_id
+                ORDER BY collected_at DESC
+            ) as rn
+        FROM post_trends
+    ),
+    active_hashtag_challenges AS (
+        -- Get challenges related to active hashtags
+        SELECT
+            ah.id as hashtag_id,
+            ah.title as hashtag_title,
+            c.id as challenge_id,
+            c.title as challenge_title
+        FROM active_hashtags ah
+        JOIN challenges c ON lower(c.title) LIKE '%' || lower(replace(ah.title, '#', '')) || '%'
+        WHERE ah.active = true
+    )
+    SELECT
+        ahc.hashtag_id as challenge_id,
+        ahc.hashtag_title as challenge_title,
+        ROUND(AVG(t.daily_growth_rate)*100, 1) as daily_growth,
+        ROUND(AVG(t.weekly_growth_rate)*100, 1) as weekly_growth,
+        ROUND(AVG(t.monthly_growth_rate)*100, 1) as monthly_growth
+    FROM active_hashtag_challenges ahc
+    JOIN posts_challenges pc ON ahc.challenge_id = pc.challenge_id
+    JOIN latest_trends t ON pc.post_id = t.post_id
+    WHERE t.rn = 1
+    GROUP BY ahc.hashtag_id, ahc.hashtag_title
+"""
+
+
+def create_trend_views(current_views: str, where: str) -> None:
+    op.execute(post_trends_view(current_views, where))
+    for column in [
+        "post_id",
+        "collected_at",
+        "daily_change",
+        "weekly_change",
+        "monthly_change",
+    ]:
+        op.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_post_trends_{column} "
+            f"ON post_trends({column})"
+        )
+
+    op.execute(CHALLENGE_TRENDS_VIEW)
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_challenge_trends_id ON challenge_trends(challenge_id)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_challenge_trends_title ON challenge_trends(challenge_title)"
+    )
+
+
+def drop_trend_views() -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS challenge_trends")
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS post_trends")
+
+
+def backfill_counters() -> None:
+    """
+    Copy the text counters into the new BIGINT columns, one batch per transaction
+    """
+    conversions = ", ".join(
+        f"{column}_bigint = CASE WHEN p.{column} ~ '^[0-9]+$' "
+        f"THEN p.{column}::BIGINT END"
+        for column in COUNTERS
+    )
+    backfill = sa.text(
+        f"""
+        WITH batch AS (
+            SELECT id, collected_at
+            FROM posts_reporting
+            WHERE (id, collected_at) > (:last_id, :last_collected_at)
+            ORDER BY id, collected_at
+            LIMIT :batch_size
+        ),
+        updated AS (
+            UPDATE posts_reporting p
+            SET {conversions}
+            FROM batch
+            WHERE p.id = batch.id AND p.collected_at = batch.collected_at
+            RETURNING p.id, p.collected_at
+        )
+        -- The last key of the batch, compared with the same collation as the keyset
+        SELECT id, collected_at
+        FROM updated
+        ORDER BY id DESC, collected_at DESC
+        LIMIT 1
+        """
+    )
+
+    connection = op.get_bind()
+    last_id, last_collected_at = "", datetime.min
+    with op.get_context().autocommit_block():
+        while True:
+            last_row = connection.execute(
+                backfill,
+                {
+                    "last_id": last_id,
+                    "last_collected_at": last_collected_at,
+                    "batch_size": BACKFILL_BATCH_SIZE,
+                },
+            ).first()
+            if last_row is None:
+                break
+            last_id, last_collected_at = last_row.id, last_row.collected_at
+
+
+def upgrade() -> None:
+    # The trend views read the counters, they are recreated on the new columns
+    drop_trend_views()
+
+    for column in COUNTERS:
+        op.add_column("posts_reporting", sa.Column(f"{column}_bigint", sa.BigInteger()))
+
+    backfill_counters()
+
+    for column in COUNTERS:
+        op.drop_column("posts_reporting", column)
+        op.alter_column("posts_reporting", f"{column}_bigint", new_column_name=column)
+
+    create_trend_views(current_views="play_count", where="play_count IS NOT NULL")
+
+
+def downgrade() -> None:
+    drop_trend_views()
+
+    for column in COUNTERS:
+        op.alter_column(
+            "posts_reporting",
+            column,
+            type_=sa.String(),
+            postgresql_using=f"{column}::VARCHAR",
+        )
+
+    create_trend_views(
+        current_views="CAST(NULLIF(play_count, '') AS NUMERIC)",
+        where="play_count IS NOT NULL AND play_count != ''",
+    )
@@ -0,0 +1,88 @@
+"""video_embeddings storage
+
+Revision ID: a1c5e9f2d704
+Revises: f4b8c2d6e013
+Create Date: 2026-10-18 18:12:40.583190
+
+"""
+
+import os
+import re
+from typing import Sequence, Union
+
+from alembic import op
+from sqlalchemy import text
+
+# revision identifiers, used by Alembic.
+revision: str = "a1c5e9f2d704"
+down_revision: Union[str, None] = "f4b8c2d6e013"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ELEMENT_TYPES = ["frame", "description"]
+
+# The storage of the VideoEmbeddings model, read from the same variables
+EMBEDDING_STORAGE = os.environ.get("EMBEDDING_STORAGE") or "vector"
+EMBEDDING_DIMENSION = int(os.environ.get("EMBEDDING_DIMENSION") or 1408)
+
+
+def set_embedding_type(storage: str, dimension: int) -> None:
+    """
+    Change the type of the embedding column and rebuild its HNSW indexes
+
+    The dimension of stored embeddings can't be changed by a cast, they are projected
+    by postgresql/reproject_embeddings.py, which leaves nothing to do here.
+    """
+    connection = op.get_bind()
+    current = connection.execute(
+        text(
+            """
+            SELECT format_type(atttypid, atttypmod)
+            FROM pg_attribute
+            WHERE attrelid = CAST('video_embeddings' AS regclass)
+                AND attname = 'embedding'
+            """
+        )
+    ).scalar()
+    if current == f"{storage}({dimension})":
+        return
+
+    current_dimension = int(re.fullmatch(r"\w+\((\d+)\)", current).group(1))
+    if (
+        current_dimension != dimension
+        and connection.execute(
+            text("SELECT EXISTS (SELECT 1 FROM video_embeddings)")
+        ).scalar()
+    ):
+        raise RuntimeError(
+            f"video_embeddings stores {current} embeddings, project them to "
+            f"{storage}({dimension}) with postgresql/reproject_embeddings.py"
+        )
+
+    for element_type in ELEMENT_TYPES:
+        op.execute(f"DROP INDEX IF EXISTS idx_video_embeddings_{element_type}_hnsw")
+    op.execute(
+        f"""
+        ALTER TABLE video_embeddings
+        ALTER COLUMN embedding TYPE {storage}({dimension})
+        USING CAST(embedding AS {storage}({dimension}))
+        """
+    )
+    for element_type in ELEMENT_TYPES:
+        op.execute(
+            f"""
+            CREATE INDEX idx_video_embeddings_{element_type}_hnsw
+            ON video_embeddings
+            USING hnsw (embedding {storage}_cosine_ops)
+            WITH (m = 16, ef_construction = 64)
+            WHERE element_type = '{element_type}'
+            """
+        )
+
+
+def upgrade() -> None:
+    set_embedding_type(EMBEDDING_STORAGE, EMBEDDING_DIMENSION)
+
+
+def downgrade() -> None:
+    set_embedding_type("vector", 1408)
@@ -0,0 +1,137 @@
+"""Partition reporting tables by month
+
+Revision ID: b2e4a7c9d031
+Revises: 8d3b6f0e2c15
+Create Date: 2026-10-18 12:03:55.904417
+
+"""
+
+from datetime import date, datetime
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b2e4a7c9d031"
+down_revision: Union[str, None] = "8d3b6f0e2c15"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ["posts_reporting", "authors_reporting"]
+
+# Materialized views reading the reporting tables, in creation order
+VIEWS = ["post_trends", "challenge_trends", "author_trends"]
+
+# Partitions created ahead of the current month, the tasks manager keeps this up
+MONTHS_AHEAD = 3
+
+
+def add_months(month: date, months: int) -> date:
+    month_index = month.year * 12 + month.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def save_views() -> list:
+    """
+    Read the definitions and indexes of the views, so they can be recreated on the new
+    tables without duplicating their SQL
+    """
+    connection = op.get_bind()
+    views = []
+    for view in VIEWS:
+        definition = connection.execute(
+            sa.text("SELECT pg_get_viewdef(CAST(:view AS regclass))"),
+            {"view": view},
+        ).scalar()
+        indexes = (
+            connection.execute(
+                sa.text("SELECT indexdef FROM pg_indexes WHERE tablename = :view"),
+                {"view": view},
+            )
+            .scalars()
+            .all()
+        )
+        views.append((view, definition, indexes))
+    return views
+
+
+def drop_views(views: list) -> None:
+    for view, _, _ in reversed(views):
+        op.execute(f"DROP MATERIALIZED VIEW IF EXISTS {view}")
+
+
+def create_views(views: list) -> None:
+    for view, definition, indexes in views:
+        op.execute(f"CREATE MATERIALIZED VIEW {view} AS {definition}")
+        for index in indexes:
+            op.execute(index)
+
+
+def first_month(table: str) -> date:
+    oldest = (
+        op.get_bind()
+        .execute(sa.text(f"SELECT MIN(collected_at) FROM {table}"))
+        .scalar()
+    )
+    month = oldest or datetime.now()
+    return date(month.year, month.month, 1)
+
+
+def replace_table(table: str, partitioned: bool) -> None:
+    """
+    Recreate the table, partitioned by month on collected_at or not, and move its rows
+    """
+    start = first_month(table)
+
+    op.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+    op.execute(
+        f"ALTER TABLE {table}_old RENAME CONSTRAINT {table}_pkey TO {table}_old_pkey"
+    )
+
+    op.execute(
+        f"""
+        CREATE TABLE {table} (
+            LIKE {table}_old INCLUDING DEFAULTS,
+            CONSTRAINT {table}_pkey PRIMARY KEY (id, collected_at)
+        ) {"PARTITION BY RANGE (collected_at)" if partitioned else ""}
+        """
+    )
+
+    if partitioned:
+        month = start
+        end = add_months(date.today().replace(day=1), MONTHS_AHEAD)
+        while month <= end:
+            op.execute(
+                f"""
+                CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {table}
+                FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')
+                """
+            )
+            month = add_months(month, 1)
+
+        # Catches rows outside the created partitions instead of failing the insert
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+    op.execute(f"INSERT INTO {table} SELECT * FROM {table}_old")
+    op.execute(f"DROP TABLE {table}_old CASCADE")
+
+
+def upgrade() -> None:
+    views = save_views()
+    drop_views(views)
+
+    for table in TABLES:
+        replace_table(table, partitioned=True)
+
+    create_views(views)
+
+
+def downgrade() -> None:
+    views = save_views()
+    drop_views(views)
+
+    for table in TABLES:
+        replace_table(table, partitioned=False)
+
+    create_views(views)
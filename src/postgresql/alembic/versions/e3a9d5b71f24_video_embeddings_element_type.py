@@ -0,0 +1,36 @@
+"""video_embeddings element_type
+
+Revision ID: e3a9d5b71f24
+Revises: c7f1a3e5b920
+Create Date: 2026-10-18 15:48:30.114902
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e3a9d5b71f24"
+down_revision: Union[str, None] = "c7f1a3e5b920"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing rows are all key frame embeddings
+    op.add_column(
+        "video_embeddings",
+        sa.Column(
+            "element_type",
+            sa.String(),
+            server_default=sa.text("'frame'"),
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM video_embeddings WHERE element_type != 'frame'")
+    op.drop_column("video_embeddings", "element_type")
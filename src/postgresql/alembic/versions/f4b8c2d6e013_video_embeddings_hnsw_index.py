@@ -0,0 +1,46 @@
+"""video_embeddings HNSW index
+
+Revision ID: f4b8c2d6e013
+Revises: e3a9d5b71f24
+Create Date: 2026-10-18 16:35:52.407316
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f4b8c2d6e013"
+down_revision: Union[str, None] = "e3a9d5b71f24"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# One index per element type, searches filter on it and the description index stays
+# small enough to be cached
+ELEMENT_TYPES = ["frame", "description"]
+
+
+def upgrade() -> None:
+    # Built concurrently, so the embeddings consumer keeps writing meanwhile
+    with op.get_context().autocommit_block():
+        for element_type in ELEMENT_TYPES:
+            op.execute(
+                f"""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS
+                    idx_video_embeddings_{element_type}_hnsw
+                ON video_embeddings
+                USING hnsw (embedding vector_cosine_ops)
+                WITH (m = 16, ef_construction = 64)
+                WHERE element_type = '{element_type}'
+                """
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for element_type in ELEMENT_TYPES:
+            op.execute(
+                "DROP INDEX CONCURRENTLY IF EXISTS "
+                f"idx_video_embeddings_{element_type}_hnsw"
+            )
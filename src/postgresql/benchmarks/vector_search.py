@@ -0,0 +1,238 @@
+"""
+Recall, size and latency of exact and HNSW searches on a synthetic embeddings corpus
+
+The corpus is made of clusters of nearby vectors, like the key frames of a video,
+spanning fewer dimensions than the vectors have, like real embeddings. It is loaded in
+an unlogged table, dropped afterwards, once per storage (vector or halfvec) and
+dimension, lower dimensions being PCA projections of the vectors. The exact nearest
+vectors at full precision and dimension are the ground truth:
+- rows / index: Size of the table and of its HNSW index in MiB
+- recall: Share of the ground truth top k found by the search
+- p50 / p95: Latency of the searches in milliseconds
+
+Example Usage (from src, with the POSTGRES_* variables set):
+    python -m postgresql.benchmarks.vector_search --rows 100000 --ef-search 40 100 400
+    python -m postgresql.benchmarks.vector_search --storages halfvec --dimensions 512
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from helpers.embeddings import EmbeddingProjection
+from postgresql.config.db import engine, session
+
+TABLE = "vector_search_benchmark"
+
+
+def synthetic_corpus(rows, dimension, intrinsic_dimension, clusters, rng):
+    """
+    Returns:
+    - np.ndarray: Unit vectors spread around random cluster centers
+    """
+    centers = rng.normal(size=(clusters, intrinsic_dimension))
+    latent = centers[rng.integers(0, clusters, rows)] + rng.normal(
+        scale=0.5, size=(rows, intrinsic_dimension)
+    )
+    basis = rng.normal(size=(intrinsic_dimension, dimension))
+    vectors = latent @ basis + rng.normal(scale=0.5, size=(rows, dimension))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def nearest(vectors, queries, k):
+    """
+    Returns:
+    - list: The indexes of the k vectors nearest to every query, by cosine distance
+    """
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    similarities = queries @ vectors.T
+    return [set(np.argpartition(-row, k)[:k].tolist()) for row in similarities]
+
+
+def to_vector(values):
+    return "[" + ",".join(f"{x:.6f}" for x in values) + "]"
+
+
+async def load_corpus(vectors, storage, m, ef_construction, chunk_size=1000):
+    """
+    Returns:
+    - tuple: Bytes taken by the rows and by the HNSW index
+    """
+    async with session() as s:
+        await s.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        await s.execute(
+            text(
+                f"""
+                CREATE UNLOGGED TABLE {TABLE} (
+                    id INTEGER PRIMARY KEY,
+                    embedding {storage}({vectors.shape[1]})
+                )
+                """
+            )
+        )
+
+        for start in range(0, len(vectors), chunk_size):
+            chunk = vectors[start : start + chunk_size]
+            await s.execute(
+                text(
+                    f"""
+                    INSERT INTO {TABLE} (id, embedding)
+                    SELECT id, CAST(embedding AS {storage})
+                    FROM unnest(CAST(:ids AS INTEGER[]), CAST(:embeddings AS TEXT[]))
+                        AS rows(id, embedding)
+                    """
+                ),
+                {
+                    "ids": list(range(start, start + len(chunk))),
+                    "embeddings": [to_vector(v) for v in chunk],
+                },
+            )
+
+        build_start = time.perf_counter()
+        await s.execute(
+            text(
+                f"""
+                CREATE INDEX {TABLE}_hnsw ON {TABLE}
+                USING hnsw (embedding {storage}_cosine_ops)
+                WITH (m = {m}, ef_construction = {ef_construction})
+                """
+            )
+        )
+        await s.execute(text(f"ANALYZE {TABLE}"))
+        await s.commit()
+        print(f"Index built in {time.perf_counter() - build_start:.1f}s")
+
+        result = await s.execute(
+            text(f"SELECT pg_table_size('{TABLE}'), pg_relation_size('{TABLE}_hnsw')")
+        )
+        return tuple(result.one())
+
+
+async def search(query, storage, k, ef_search=None):
+    """
+    Returns:
+    - tuple: The ids of the k nearest vectors, and the latency in milliseconds
+    """
+    async with session() as s:
+        if ef_search is None:
+            await s.execute(text("SET LOCAL enable_indexscan = off"))
+        else:
+            await s.execute(
+                text("SELECT set_config('hnsw.ef_search', :ef_search, true)"),
+                {"ef_search": str(ef_search)},
+            )
+
+        start = time.perf_counter()
+        result = await s.execute(
+            text(
+                f"""
+                SELECT id
+                FROM {TABLE}
+                ORDER BY embedding <=> CAST(:query AS {storage})
+                LIMIT :k
+                """
+            ),
+            {"query": query, "k": k},
+        )
+        ids = result.scalars().all()
+        latency = (time.perf_counter() - start) * 1000
+        await s.rollback()
+    return ids, latency
+
+
+def report(storage, dimension, sizes, name, recalls, latencies):
+    print(
+        f"{storage:>8} {dimension:>9} "
+        f"{sizes[0] / 2**20:>8.1f} {sizes[1] / 2**20:>8.1f} "
+        f"{name:>12} {np.mean(recalls):>7.3f} "
+        f"{np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 95):>8.1f}"
+    )
+
+
+async def benchmark(vectors, queries, truth, storage, dimension, args):
+    """
+    Load the corpus with a storage and a dimension, and report its searches
+    """
+    if dimension < vectors.shape[1]:
+        projection = EmbeddingProjection.fit(vectors[: args.sample], dimension)
+        vectors = projection.project(vectors)
+        queries = projection.project(queries)
+    queries = [to_vector(q) for q in queries]
+
+    print(f"Loading {len(vectors)} vectors as {storage}({dimension})")
+    sizes = await load_corpus(vectors, storage, args.m, args.ef_construction)
+
+    results = []
+    for name, ef_search in [("exact", None)] + [
+        (f"hnsw ef={ef}", ef) for ef in args.ef_search
+    ]:
+        recalls, latencies = [], []
+        for query, expected in zip(queries, truth):
+            ids, latency = await search(query, storage, args.k, ef_search)
+            recalls.append(len(expected & set(ids)) / len(expected))
+            latencies.append(latency)
+        results.append((storage, dimension, sizes, name, recalls, latencies))
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=1408)
+    parser.add_argument("--intrinsic-dimension", type=int, default=64)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=64)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[40, 100, 200, 400])
+    parser.add_argument(
+        "--storages", nargs="+", choices=["vector", "halfvec"], default=["vector"]
+    )
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        nargs="+",
+        help="Dimensions the vectors are projected to, only the full one if unset",
+    )
+    parser.add_argument(
+        "--sample", type=int, default=20000, help="Vectors the PCA is fitted on"
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = synthetic_corpus(
+        args.rows, args.dimension, args.intrinsic_dimension, args.clusters, rng
+    )
+    # Queries close to stored vectors, like a frame of an indexed video
+    queries = vectors[rng.integers(0, args.rows, args.queries)] + rng.normal(
+        scale=0.01, size=(args.queries, args.dimension)
+    )
+    truth = nearest(vectors, queries, args.k)
+
+    results = []
+    try:
+        for storage in args.storages:
+            for dimension in args.dimensions or [args.dimension]:
+                results += await benchmark(
+                    vectors, queries, truth, storage, dimension, args
+                )
+    finally:
+        async with session() as s:
+            await s.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+            await s.commit()
+        await engine.dispose()
+
+    print(
+        f"{'storage':>8} {'dimension':>9} {'rows MiB':>8} {'idx MiB':>8} "
+        f"{'search':>12} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8}"
+    )
+    for result in results:
+        report(*result)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -10,10 +10,12 @@ from postgresql.database_models.post_trends import *
 from postgresql.database_models.posts import *
 from postgresql.database_models.posts_challenges import *
 from postgresql.database_models.posts_reporting import *
+from postgresql.database_models.rate_limits import *
 from postgresql.database_models.related_hashtags import *
 from postgresql.database_models.rule_mining_log import *
 from postgresql.database_models.users import *
 from postgresql.database_models.video_embeddings import *
+from postgresql.database_models.video_fingerprints import *
 
 __all__ = ["Base", "Posts", "VideoEmbeddings"]
 
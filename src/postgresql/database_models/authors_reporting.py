@@ -20,7 +20,11 @@ class AuthorsReporting(Base):
     heart_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     video_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
 
-    __table_args__ = (PrimaryKeyConstraint("id", "collected_at"),)
+    # Partitioned by month, partitions are managed by the tasks manager
+    __table_args__ = (
+        PrimaryKeyConstraint("id", "collected_at"),
+        {"postgresql_partition_by": "RANGE (collected_at)"},
+    )
 
     def __repr__(self) -> str:
         return (
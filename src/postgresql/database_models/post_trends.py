@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import DateTime, Numeric, String, text
+from sqlalchemy import BigInteger, DateTime, Numeric, String, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -13,10 +13,10 @@ class PostTrends(Base):
 
     post_id: Mapped[str] = mapped_column(String, primary_key=True)
     collected_at: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
-    current_views: Mapped[int] = mapped_column(Numeric)
-    daily_change: Mapped[int] = mapped_column(Numeric)
-    weekly_change: Mapped[int] = mapped_column(Numeric)
-    monthly_change: Mapped[int] = mapped_column(Numeric)
+    current_views: Mapped[int] = mapped_column(BigInteger)
+    daily_change: Mapped[int] = mapped_column(BigInteger)
+    weekly_change: Mapped[int] = mapped_column(BigInteger)
+    monthly_change: Mapped[int] = mapped_column(BigInteger)
     daily_growth_rate: Mapped[float] = mapped_column(Numeric(10, 2))
     weekly_growth_rate: Mapped[float] = mapped_column(Numeric(10, 2))
     monthly_growth_rate: Mapped[float] = mapped_column(Numeric(10, 2))
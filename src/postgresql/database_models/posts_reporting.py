@@ -1,6 +1,6 @@
 from typing import Optional
 
-from sqlalchemy import DateTime, String, func
+from sqlalchemy import BigInteger, DateTime, String, func
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.schema import PrimaryKeyConstraint
 
@@ -14,15 +14,19 @@ class PostsReporting(Base):
     collected_at: Mapped[DateTime] = mapped_column(
         DateTime, primary_key=True, default=func.now()
     )
-    collect_count: Mapped[Optional[str]] = mapped_column(String, nullable=True)
-    comment_count: Mapped[Optional[str]] = mapped_column(String, nullable=True)
-    digg_count: Mapped[Optional[str]] = mapped_column(String, nullable=True)
-    play_count: Mapped[Optional[str]] = mapped_column(String, nullable=True)
-    repost_count: Mapped[Optional[str]] = mapped_column(String, nullable=True)
-    share_count: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    collect_count: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    comment_count: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    digg_count: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    play_count: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    repost_count: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    share_count: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
     url: Mapped[Optional[str]] = mapped_column(String, nullable=True)
 
-    __table_args__ = (PrimaryKeyConstraint("id", "collected_at"),)
+    # Partitioned by month, partitions are managed by the tasks manager
+    __table_args__ = (
+        PrimaryKeyConstraint("id", "collected_at"),
+        {"postgresql_partition_by": "RANGE (collected_at)"},
+    )
 
     def __repr__(self) -> str:
         return (
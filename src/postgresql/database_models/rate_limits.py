@@ -0,0 +1,25 @@
+from sqlalchemy import DateTime, Float, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class RateLimits(Base):
+    """
+    Token buckets shared by the replicas of a service calling a rate limited API
+    """
+
+    __tablename__ = "rate_limits"
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float)
+    updated_at: Mapped[DateTime] = mapped_column(DateTime, server_default=func.now())
+
+    def __repr__(self) -> str:
+        return (
+            f"RateLimits("
+            f"name={self.name}, "
+            f"tokens={self.tokens}, "
+            f"updated_at={self.updated_at}"
+            f")"
+        )
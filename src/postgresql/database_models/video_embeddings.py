@@ -1,11 +1,25 @@
+import os
+
 import sqlalchemy as sa
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import HALFVEC, Vector
 from sqlalchemy import Column, ForeignKey, Integer, String
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from .base import Base
 
+# Kinds of embeddings of a post, the description is stored at element_id 0 and the
+# key frames from element_id 1 on
+FRAME_ELEMENT = "frame"
+DESCRIPTION_ELEMENT = "description"
+ELEMENT_TYPES = (FRAME_ELEMENT, DESCRIPTION_ELEMENT)
+
+# How the embeddings are stored, changed with postgresql/reproject_embeddings.py:
+# vector (4 bytes per dimension) or halfvec (2 bytes), and the number of dimensions
+EMBEDDING_STORAGE = os.environ.get("EMBEDDING_STORAGE") or "vector"
+EMBEDDING_DIMENSION = int(os.environ.get("EMBEDDING_DIMENSION") or 1408)
+EMBEDDING_TYPES = {"vector": Vector, "halfvec": HALFVEC}
+
 
 class VideoEmbeddings(Base):
     __tablename__ = "video_embeddings"
@@ -14,7 +28,8 @@ class VideoEmbeddings(Base):
         String, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True
     )
     element_id = Column(Integer, primary_key=True)
-    embedding = Column(Vector(1408))
+    element_type = Column(String, nullable=False, server_default=FRAME_ELEMENT)
+    embedding = Column(EMBEDDING_TYPES[EMBEDDING_STORAGE](EMBEDDING_DIMENSION))
 
     posts = relationship("Posts", back_populates="video_embeddings")
 
@@ -0,0 +1,29 @@
+from typing import Optional
+
+from sqlalchemy import DateTime, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class VideoFingerprints(Base):
+    """
+    Videos that were sent to the video processor, keyed on post id and content hash
+    """
+
+    __tablename__ = "video_fingerprints"
+
+    post_id: Mapped[str] = mapped_column(String, primary_key=True)
+    content_sha256: Mapped[str] = mapped_column(String, primary_key=True)
+    published_at: Mapped[DateTime] = mapped_column(DateTime, server_default=func.now())
+    embedded_at: Mapped[Optional[DateTime]] = mapped_column(DateTime, nullable=True)
+
+    def __repr__(self) -> str:
+        return (
+            f"VideoFingerprints("
+            f"post_id={self.post_id}, "
+            f"content_sha256={self.content_sha256}, "
+            f"published_at={self.published_at}, "
+            f"embedded_at={self.embedded_at}"
+            f")"
+        )
@@ -30,3 +30,28 @@ async def insert_author(
             verified=verified,
         )
     )
+
+
+async def insert_author_batch(rows: list[dict], session) -> None:
+    """
+    Insert many authors in one executemany round trip
+
+    Rows have the same keys as the parameters of insert_author.
+    """
+    if not rows:
+        return
+
+    await session.execute(
+        text(
+            """
+            INSERT INTO authors (
+                id, nickname, signature, unique_id, verified
+            ) 
+            VALUES (
+                :id, :nickname, :signature, :unique_id, :verified
+            )
+            ON CONFLICT (id) DO NOTHING
+            """
+        ),
+        rows,
+    )
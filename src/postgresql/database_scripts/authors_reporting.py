@@ -2,6 +2,8 @@ from datetime import datetime
 
 from sqlalchemy import text
 
+from postgresql.database_scripts.bulk_copy import copy_and_merge
+
 
 async def insert_author_stats(
     id: str,
@@ -38,6 +40,29 @@ async def insert_author_stats(
     )
 
 
+async def insert_author_stats_batch(rows: list[dict], session) -> None:
+    """
+    Insert many author stats snapshots with COPY
+
+    Rows have the same keys as the parameters of insert_author_stats.
+    """
+    await copy_and_merge(
+        "authors_reporting",
+        columns=[
+            "id",
+            "collected_at",
+            "digg_count",
+            "follower_count",
+            "following_count",
+            "heart_count",
+            "video_count",
+        ],
+        rows=rows,
+        conflict_columns=["id", "collected_at"],
+        session=session,
+    )
+
+
 async def get_top_authors(
     start_date: datetime,
     end_date: datetime,
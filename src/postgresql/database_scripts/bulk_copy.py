@@ -0,0 +1,63 @@
+from sqlalchemy import text
+
+
+async def copy_and_merge(
+    table: str,
+    columns: list[str],
+    rows: list[dict],
+    conflict_columns: list[str],
+    session,
+) -> None:
+    """
+    Bulk insert rows with COPY, skipping rows that already exist
+
+    The rows are copied into a temporary staging table with the binary COPY protocol,
+    then merged into the table with a single INSERT ... SELECT. This is much faster
+    than one INSERT per row for the append-only reporting tables.
+
+    The staging table lives as long as the pooled connection and is emptied after
+    every merge.
+
+    Parameters:
+    - table: str: The table to insert into
+    - columns: list[str]: The columns to copy, the keys of the rows
+    - rows: list[dict]: The rows to insert
+    - conflict_columns: list[str]: The unique columns of the table
+    - session: AsyncSession: The database session, inside a transaction
+    """
+    if not rows:
+        return
+
+    staging_table = f"{table}_staging"
+    column_list = ", ".join(columns)
+
+    # Also starts the transaction on the connection before COPY runs on it
+    await session.execute(
+        text(
+            f"""
+            CREATE TEMP TABLE IF NOT EXISTS {staging_table}
+            (LIKE {table} INCLUDING DEFAULTS)
+            ON COMMIT DELETE ROWS
+            """
+        )
+    )
+
+    # COPY is not exposed by SQLAlchemy, use the asyncpg connection underneath
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        staging_table,
+        records=[tuple(row[column] for column in columns) for row in rows],
+        columns=columns,
+    )
+
+    await session.execute(
+        text(
+            f"""
+            INSERT INTO {table} ({column_list})
+            SELECT {column_list} FROM {staging_table}
+            ON CONFLICT ({", ".join(conflict_columns)}) DO NOTHING
+            """
+        )
+    )
+    await session.execute(text(f"TRUNCATE {staging_table}"))
@@ -21,3 +21,29 @@ async def insert_or_update_challenge(
             description=description,
         )
     )
+
+
+async def insert_or_update_challenge_batch(rows: list[dict], session) -> None:
+    """
+    Upsert many challenges in one executemany round trip
+
+    Every row counts as one occurrence of the challenge, like a call to
+    insert_or_update_challenge.
+    """
+    if not rows:
+        return
+
+    await session.execute(
+        text(
+            """
+            INSERT INTO challenges (id, title, description, hashtag_count) 
+            VALUES (:id, :title, :description, 1)
+            ON CONFLICT (id) 
+            DO UPDATE SET 
+                title = EXCLUDED.title,
+                description = EXCLUDED.description,
+                hashtag_count = challenges.hashtag_count + 1
+            """
+        ),
+        rows,
+    )
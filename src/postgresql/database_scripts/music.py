@@ -19,3 +19,24 @@ async def insert_music(
             original=original,
         )
     )
+
+
+async def insert_music_batch(rows: list[dict], session) -> None:
+    """
+    Insert many music tracks in one executemany round trip
+
+    Rows have the same keys as the parameters of insert_music.
+    """
+    if not rows:
+        return
+
+    await session.execute(
+        text(
+            """
+            INSERT INTO music (id, author_name, title, duration, original) 
+            VALUES (:id, :author_name, :title, :duration, :original)
+            ON CONFLICT (id) DO NOTHING
+            """
+        ),
+        rows,
+    )
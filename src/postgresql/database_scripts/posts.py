@@ -40,3 +40,30 @@ async def insert_post(
             url=url,
         )
     )
+
+
+async def insert_post_batch(rows: list[dict], session) -> None:
+    """
+    Insert many posts in one executemany round trip
+
+    Rows have the same keys as the parameters of insert_post.
+    """
+    if not rows:
+        return
+
+    await session.execute(
+        text(
+            """
+            INSERT INTO posts (
+                id, created_at, description, duet_enabled, duet_from_id, 
+                is_ad, can_repost, author_id, music_id, url
+            ) 
+            VALUES (
+                :id, :created_at, :description, :duet_enabled, :duet_from_id, 
+                :is_ad, :can_repost, :author_id, :music_id, :url
+            )
+            ON CONFLICT (id) DO NOTHING
+            """
+        ),
+        rows,
+    )
@@ -14,3 +14,24 @@ async def insert_post_challenge(post_id: str, challenge_id: str, session) -> Non
             challenge_id=challenge_id,
         )
     )
+
+
+async def insert_post_challenge_batch(rows: list[dict], session) -> None:
+    """
+    Insert many post challenges in one executemany round trip
+
+    Rows have the same keys as the parameters of insert_post_challenge.
+    """
+    if not rows:
+        return
+
+    await session.execute(
+        text(
+            """
+            INSERT INTO posts_challenges (post_id, challenge_id) 
+            VALUES (:post_id, :challenge_id)
+            ON CONFLICT (post_id, challenge_id) DO NOTHING
+            """
+        ),
+        rows,
+    )
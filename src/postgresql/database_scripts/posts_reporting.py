@@ -2,6 +2,8 @@ from datetime import datetime
 
 from sqlalchemy import text
 
+from postgresql.database_scripts.bulk_copy import copy_and_merge
+
 
 async def insert_post_stats(
     id: str,
@@ -9,9 +11,9 @@ async def insert_post_stats(
     collect_count: int,
     comment_count: int,
     digg_count: int,
-    play_count: str,
-    repost_count: str,
-    share_count: str,
+    play_count: int,
+    repost_count: int,
+    share_count: int,
     url: str,
     session,
 ) -> None:
@@ -42,6 +44,31 @@ async def insert_post_stats(
     )
 
 
+async def insert_post_stats_batch(rows: list[dict], session) -> None:
+    """
+    Insert many post stats snapshots with COPY
+
+    Rows have the same keys as the parameters of insert_post_stats.
+    """
+    await copy_and_merge(
+        "posts_reporting",
+        columns=[
+            "id",
+            "collected_at",
+            "collect_count",
+            "comment_count",
+            "digg_count",
+            "play_count",
+            "repost_count",
+            "share_count",
+            "url",
+        ],
+        rows=rows,
+        conflict_columns=["id", "collected_at"],
+        session=session,
+    )
+
+
 async def get_top_posts(
     start_date: datetime,
     end_date: datetime,
@@ -122,7 +149,7 @@ async def get_top_posts(
         FROM posts
         INNER JOIN posts_reporting ON posts.id = posts_reporting.id
         LEFT JOIN authors ON posts.author_id = authors.id
-        ORDER BY CAST(posts_reporting.{category} AS INTEGER) DESC
+        ORDER BY posts_reporting.{category} DESC NULLS LAST
         LIMIT :limit
     """
     )
@@ -211,7 +238,7 @@ async def get_top_feed_posts(
         FROM posts
         INNER JOIN posts_reporting ON posts.id = posts_reporting.id
         LEFT JOIN authors ON posts.author_id = authors.id
-        ORDER BY CAST(posts_reporting.appearances_in_feed AS INTEGER) DESC
+        ORDER BY posts_reporting.appearances_in_feed DESC
         LIMIT :limit
     """
     )
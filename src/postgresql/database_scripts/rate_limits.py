@@ -0,0 +1,67 @@
+from sqlalchemy import text
+
+
+async def take_tokens(
+    name: str, tokens: float, rate: float, capacity: float, session
+) -> float:
+    """
+    Take tokens from a shared token bucket
+
+    The bucket is refilled for the time elapsed since it was last used. Its row stays
+    locked until the transaction ends, so concurrent replicas never take the same tokens.
+
+    Parameters:
+    - name: str: The name of the bucket
+    - tokens: float: The number of tokens to take
+    - rate: float: Tokens added to the bucket per second
+    - capacity: float: Maximum number of tokens in the bucket
+    - session: AsyncSession: The database session
+
+    Returns:
+    - float: 0 if the tokens were taken, otherwise the seconds to wait before the
+      bucket has enough tokens
+    """
+    await session.execute(
+        text(
+            """
+            INSERT INTO rate_limits (name, tokens, updated_at)
+            VALUES (:name, CAST(:capacity AS DOUBLE PRECISION), clock_timestamp())
+            -- Locks the row until the end of the transaction, also when it exists
+            ON CONFLICT (name) DO UPDATE SET tokens = rate_limits.tokens
+            """
+        ).params(name=name, capacity=capacity)
+    )
+
+    result = await session.execute(
+        text(
+            """
+            WITH bucket AS (
+                SELECT
+                    clock.now,
+                    LEAST(
+                        CAST(:capacity AS DOUBLE PRECISION),
+                        tokens + CAST(:rate AS DOUBLE PRECISION)
+                            * EXTRACT(EPOCH FROM clock.now - updated_at)
+                    ) AS available
+                FROM rate_limits, (SELECT clock_timestamp() AS now) AS clock
+                WHERE name = :name
+            )
+            UPDATE rate_limits
+            SET
+                tokens = CASE
+                    WHEN bucket.available >= CAST(:tokens AS DOUBLE PRECISION)
+                    THEN bucket.available - CAST(:tokens AS DOUBLE PRECISION)
+                    ELSE bucket.available
+                END,
+                updated_at = bucket.now
+            FROM bucket
+            WHERE rate_limits.name = :name
+            RETURNING GREATEST(
+                0,
+                (CAST(:tokens AS DOUBLE PRECISION) - bucket.available)
+                    / CAST(:rate AS DOUBLE PRECISION)
+            ) AS wait
+            """
+        ).params(name=name, tokens=tokens, rate=rate, capacity=capacity)
+    )
+    return result.scalar_one()
@@ -0,0 +1,127 @@
+from datetime import date
+
+from sqlalchemy import text
+
+# Snapshot tables partitioned by month on collected_at
+REPORTING_TABLES = ["posts_reporting", "authors_reporting"]
+
+
+def add_months(month: date, months: int) -> date:
+    month_index = month.year * 12 + month.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+async def get_partitions(table: str, session) -> list[str]:
+    result = await session.execute(
+        text(
+            """
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:table AS regclass)
+            ORDER BY c.relname
+            """
+        ).params(table=table)
+    )
+    return result.scalars().all()
+
+
+async def create_partitions(table: str, months_ahead: int, session) -> list[str]:
+    """
+    Create the monthly partitions of a table from the current month to months_ahead
+    months in the future, if they don't exist yet
+
+    Rows of a month without a partition land in the default partition, and a partition
+    can't be created while the default one holds rows of its range. The default
+    partition is detached meanwhile and its rows of the month moved to the new one.
+
+    Parameters:
+    - table: str: The partitioned table
+    - months_ahead: int: Number of future months to create partitions for
+    - session: AsyncSession: The database session
+
+    Returns:
+    - list[str]: The names of the created partitions
+    """
+    existing = set(await get_partitions(table, session))
+    this_month = date.today().replace(day=1)
+
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(this_month, offset)
+        name = partition_name(table, month)
+        if name in existing:
+            continue
+
+        default = default_partition_name(table)
+        in_month = (
+            f"collected_at >= '{month}' AND collected_at < '{add_months(month, 1)}'"
+        )
+        move_rows = False
+        if default in existing:
+            result = await session.execute(
+                text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_month})")
+            )
+            move_rows = result.scalar()
+
+        if move_rows:
+            await session.execute(
+                text(f"ALTER TABLE {table} DETACH PARTITION {default}")
+            )
+        await session.execute(
+            text(
+                f"""
+                CREATE TABLE {name} PARTITION OF {table}
+                FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')
+                """
+            )
+        )
+        if move_rows:
+            await session.execute(
+                text(f"INSERT INTO {table} SELECT * FROM {default} WHERE {in_month}")
+            )
+            await session.execute(text(f"DELETE FROM {default} WHERE {in_month}"))
+            await session.execute(
+                text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+            )
+        created.append(name)
+
+    return created
+
+
+async def detach_old_partitions(
+    table: str, retention_months: int, session
+) -> list[str]:
+    """
+    Detach the monthly partitions that are entirely older than retention_months
+
+    Detached partitions are kept as standalone tables, so they can be archived or
+    dropped, but queries on the parent table no longer read them.
+
+    Parameters:
+    - table: str: The partitioned table
+    - retention_months: int: Number of past months to keep, besides the current one
+    - session: AsyncSession: The database session
+
+    Returns:
+    - list[str]: The names of the detached partitions
+    """
+    oldest_kept = add_months(date.today().replace(day=1), -retention_months)
+    oldest_kept_name = partition_name(table, oldest_kept)
+
+    detached = []
+    for name in await get_partitions(table, session):
+        # Monthly partitions are named {table}_pYYYYMM, so names sort by month
+        if name.startswith(f"{table}_p") and name < oldest_kept_name:
+            await session.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            detached.append(name)
+
+    return detached
@@ -0,0 +1,181 @@
+import json
+import re
+
+import numpy as np
+from sqlalchemy import text
+
+from postgresql.database_models.video_embeddings import ELEMENT_TYPES
+
+
+def hnsw_index_name(element_type: str) -> str:
+    return f"idx_video_embeddings_{element_type}_hnsw"
+
+
+async def get_embedding_type(session) -> tuple[str, int]:
+    """
+    Returns:
+    - tuple: The type of the stored embeddings (vector or halfvec) and their dimension
+    """
+    result = await session.execute(
+        text(
+            """
+            SELECT format_type(atttypid, atttypmod)
+            FROM pg_attribute
+            WHERE attrelid = CAST('video_embeddings' AS regclass)
+                AND attname = 'embedding'
+            """
+        )
+    )
+    storage, dimension = re.fullmatch(r"(\w+)\((\d+)\)", result.scalar()).groups()
+    return storage, int(dimension)
+
+
+async def get_table_sizes(session) -> tuple[int, int]:
+    """
+    Returns:
+    - tuple: Bytes taken by the rows of video_embeddings and by its indexes
+    """
+    result = await session.execute(
+        text(
+            """
+            SELECT
+                pg_table_size('video_embeddings'),
+                pg_indexes_size('video_embeddings')
+            """
+        )
+    )
+    return tuple(result.one())
+
+
+async def drop_hnsw_indexes(session):
+    for element_type in ELEMENT_TYPES:
+        await session.execute(
+            text(f"DROP INDEX IF EXISTS {hnsw_index_name(element_type)}")
+        )
+
+
+async def create_hnsw_indexes(storage: str, session):
+    """
+    Create the HNSW index of every element type for the storage type of the embeddings
+    """
+    for element_type in ELEMENT_TYPES:
+        await session.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS {hnsw_index_name(element_type)}
+                ON video_embeddings
+                USING hnsw (embedding {storage}_cosine_ops)
+                WITH (m = 16, ef_construction = 64)
+                WHERE element_type = '{element_type}'
+                """
+            )
+        )
+
+
+async def sample_embeddings(size: int, session) -> np.ndarray:
+    """
+    Sample the embeddings of every element type in equal parts, so a projection fitted
+    on them is centered between image and text embeddings, not on the key frames,
+    which far outnumber the descriptions
+
+    Returns:
+    - np.ndarray: Up to size embeddings picked at random, one per row
+    """
+    embeddings = []
+    for element_type in ELEMENT_TYPES:
+        result = await session.execute(
+            text(
+                """
+                SELECT CAST(embedding AS TEXT)
+                FROM video_embeddings
+                WHERE element_type = :element_type AND embedding IS NOT NULL
+                ORDER BY random()
+                LIMIT :size
+                """
+            ).params(element_type=element_type, size=size // len(ELEMENT_TYPES))
+        )
+        embeddings += [json.loads(embedding) for embedding in result.scalars()]
+    return np.array(embeddings)
+
+
+async def convert_embeddings(
+    storage: str, dimension: int, session, projection=None, batch_size: int = 1000
+) -> int:
+    """
+    Change the type of the stored embeddings, projecting them to fewer dimensions if
+    a projection is given. The HNSW indexes have to be dropped first.
+
+    Parameters:
+    - storage: str: The new type of the embeddings, vector or halfvec
+    - dimension: int: The new dimension of the embeddings
+    - session: AsyncSession: The database session
+    - projection: EmbeddingProjection: Projection to dimension, None to keep them as is
+    - batch_size: int: Embeddings projected at a time
+
+    Returns:
+    - int: The number of projected embeddings
+    """
+    if projection is None:
+        await session.execute(
+            text(
+                f"""
+                ALTER TABLE video_embeddings
+                ALTER COLUMN embedding TYPE {storage}({dimension})
+                USING CAST(embedding AS {storage}({dimension}))
+                """
+            )
+        )
+        return 0
+
+    await session.execute(
+        text(f"ALTER TABLE video_embeddings ADD COLUMN reduced {storage}({dimension})")
+    )
+
+    projected = 0
+    last_key = ("", -1)
+    while True:
+        result = await session.execute(
+            text(
+                """
+                SELECT post_id, element_id, CAST(embedding AS TEXT)
+                FROM video_embeddings
+                WHERE (post_id, element_id) > (:post_id, :element_id)
+                    AND embedding IS NOT NULL
+                ORDER BY post_id, element_id
+                LIMIT :batch_size
+                """
+            ).params(post_id=last_key[0], element_id=last_key[1], batch_size=batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            break
+
+        embeddings = projection.project([json.loads(row[2]) for row in rows])
+        await session.execute(
+            text(
+                f"""
+                UPDATE video_embeddings v
+                SET reduced = CAST(u.embedding AS {storage})
+                FROM unnest(
+                    CAST(:post_ids AS VARCHAR[]),
+                    CAST(:element_ids AS INTEGER[]),
+                    CAST(:embeddings AS TEXT[])
+                ) AS u(post_id, element_id, embedding)
+                WHERE v.post_id = u.post_id AND v.element_id = u.element_id
+                """
+            ).params(
+                post_ids=[row[0] for row in rows],
+                element_ids=[row[1] for row in rows],
+                embeddings=[json.dumps(e) for e in embeddings.tolist()],
+            )
+        )
+
+        projected += len(rows)
+        last_key = rows[-1][:2]
+        print(f"Projected {projected} embeddings")
+
+    await session.execute(text("ALTER TABLE video_embeddings DROP COLUMN embedding"))
+    await session.execute(
+        text("ALTER TABLE video_embeddings RENAME COLUMN reduced TO embedding")
+    )
+    return projected
@@ -0,0 +1,85 @@
+from sqlalchemy import text
+
+
+async def should_download_video(post_id: str, pending_timeout: int, session) -> bool:
+    """
+    Check if a video still has to be downloaded and processed
+
+    A video is skipped if it was already embedded, or if it was sent to the video
+    processor less than pending_timeout seconds ago and is still being processed.
+
+    Parameters:
+    - post_id: str: The id of the post
+    - pending_timeout: int: Seconds after which an unfinished video is sent again
+    - session: AsyncSession: The database session
+
+    Returns:
+    - bool: True if the video has to be downloaded
+    """
+    result = await session.execute(
+        text(
+            """
+            SELECT 1
+            FROM video_fingerprints
+            WHERE post_id = :post_id
+            AND (
+                embedded_at IS NOT NULL
+                OR published_at > now() - make_interval(secs => :pending_timeout)
+            )
+            LIMIT 1
+            """
+        ).params(post_id=post_id, pending_timeout=pending_timeout)
+    )
+    return result.first() is None
+
+
+async def claim_video(
+    post_id: str, content_sha256: str, pending_timeout: int, session
+) -> bool:
+    """
+    Record that a video is sent to the video processor
+
+    Concurrent producers downloading the same video race on the primary key,
+    only one of them gets the claim.
+
+    Parameters:
+    - post_id: str: The id of the post
+    - content_sha256: str: The SHA-256 of the video bytes
+    - pending_timeout: int: Seconds after which an unfinished video can be claimed again
+    - session: AsyncSession: The database session
+
+    Returns:
+    - bool: True if the video has to be published
+    """
+    result = await session.execute(
+        text(
+            """
+            INSERT INTO video_fingerprints (post_id, content_sha256, published_at)
+            VALUES (:post_id, :content_sha256, now())
+            ON CONFLICT (post_id, content_sha256) DO UPDATE
+            SET published_at = now()
+            WHERE video_fingerprints.embedded_at IS NULL
+            AND video_fingerprints.published_at
+                < now() - make_interval(secs => :pending_timeout)
+            RETURNING post_id
+            """
+        ).params(
+            post_id=post_id,
+            content_sha256=content_sha256,
+            pending_timeout=pending_timeout,
+        )
+    )
+    return result.first() is not None
+
+
+async def mark_video_embedded(post_id: str, content_sha256: str, session) -> None:
+    await session.execute(
+        text(
+            """
+            UPDATE video_fingerprints
+            SET embedded_at = now()
+            WHERE post_id = :post_id
+            AND content_sha256 = :content_sha256
+            """
+        ).params(post_id=post_id, content_sha256=content_sha256)
+    )
@@ -0,0 +1,117 @@
+"""
+Change how video_embeddings stores the embeddings, to shrink the table and its HNSW
+indexes until they fit in shared buffers
+
+- halfvec stores every dimension in 2 bytes instead of 4
+- A lower dimension projects the stored embeddings with a PCA fitted on a sample of
+  them. The projection is saved, EMBEDDING_PROJECTION has to point the video
+  processor and the backend to it, new embeddings are projected the same way. It
+  takes embeddings of the model's dimension, so embeddings are only projected once.
+
+Stop the video processor and the embeddings consumer first, then restart them and the
+backend with EMBEDDING_STORAGE and EMBEDDING_DIMENSION set to the new storage. Alembic
+reads them too, the migration of the embedding column finds it already converted.
+
+Example Usage (from src, with the POSTGRES_* variables set):
+    python -m postgresql.reproject_embeddings --storage halfvec
+    python -m postgresql.reproject_embeddings --storage halfvec --dimension 256 \\
+        --projection ../docker_runtime/models/projection.npz
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy import text
+
+from helpers.embeddings import EMBEDDING_DIMENSION, EmbeddingProjection
+from postgresql.config.db import engine, session
+from postgresql.database_scripts.video_embeddings import (
+    convert_embeddings,
+    create_hnsw_indexes,
+    drop_hnsw_indexes,
+    get_embedding_type,
+    get_table_sizes,
+    sample_embeddings,
+)
+
+
+def print_sizes(label, sizes):
+    table_size, indexes_size = sizes
+    print(
+        f"{label}: rows {table_size / 2**20:.1f} MiB, "
+        f"indexes {indexes_size / 2**20:.1f} MiB"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--storage", choices=["vector", "halfvec"], required=True)
+    parser.add_argument(
+        "--dimension", type=int, help="Dimension to project to, the current if unset"
+    )
+    parser.add_argument("--projection", help="File the fitted projection is saved to")
+    parser.add_argument(
+        "--sample", type=int, default=20000, help="Embeddings the PCA is fitted on"
+    )
+    args = parser.parse_args()
+
+    async with session() as s:
+        storage, dimension = await get_embedding_type(s)
+        print(f"Embeddings are stored as {storage}({dimension})")
+        print_sizes("Before", await get_table_sizes(s))
+
+        target_dimension = args.dimension or dimension
+        if target_dimension > dimension:
+            parser.error(
+                "Embeddings can't be projected to more dimensions, re-embed the videos"
+            )
+
+        projection = None
+        if target_dimension < dimension:
+            if not args.projection:
+                parser.error("--projection is required to change the dimension")
+            # The projection is applied to the embeddings of the model, a projection
+            # fitted on embeddings already projected can't take them
+            if dimension != EMBEDDING_DIMENSION:
+                parser.error(
+                    f"Embeddings are already projected from {EMBEDDING_DIMENSION} to "
+                    f"{dimension} dimensions, re-embed the videos to project them "
+                    "to another dimension"
+                )
+            sample = await sample_embeddings(args.sample, s)
+            projection = EmbeddingProjection.fit(sample, target_dimension)
+            print(f"Fitted the projection on {len(sample)} embeddings")
+
+        if (args.storage, target_dimension) != (storage, dimension):
+            await drop_hnsw_indexes(s)
+            await convert_embeddings(args.storage, target_dimension, s, projection)
+
+        if projection is not None:
+            # Saved before committing, the new embeddings must never lack it
+            projection.save(args.projection)
+            print(f"Saved the projection to {args.projection}")
+        await s.commit()
+
+    if projection is not None:
+        # Rewrite the table, the dropped column still takes its space until then
+        async with engine.connect() as connection:
+            connection = await connection.execution_options(
+                isolation_level="AUTOCOMMIT"
+            )
+            await connection.execute(text("VACUUM FULL video_embeddings"))
+
+    async with session() as s:
+        print("Building the HNSW indexes")
+        await create_hnsw_indexes(args.storage, s)
+        await s.execute(text("ANALYZE video_embeddings"))
+        await s.commit()
+
+        storage, dimension = await get_embedding_type(s)
+        print(f"Embeddings are stored as {storage}({dimension})")
+        print_sizes("After", await get_table_sizes(s))
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from typing import TYPE_CHECKING, ClassVar, Iterator, Optional
 
 from ..exceptions import *
@@ -83,13 +84,14 @@ class Hashtag:
         self.__extract_from_data()
         return resp
 
-    async def videos(self, count=30, cursor=0, **kwargs) -> Iterator[Video]:
+    async def videos(self, count=30, cursor=0, prefetch=0, **kwargs) -> Iterator[Video]:
         """
         Returns TikTok videos that have this hashtag in the caption.
 
         Args:
             count (int): The amount of videos you want returned.
             cursor (int): The the offset of videos from 0 you want to get.
+            prefetch (int): The amount of pages fetched ahead in the background while the caller processes the current one, 0 fetches a page only when the previous one is consumed.
 
         Returns:
             async iterator/generator: Yields TikTokApi.video objects.
@@ -108,25 +110,16 @@ class Hashtag:
         if id is None:
             await self.info(**kwargs)
 
+        if prefetch > 0:
+            async for video in self.__videos_read_ahead(
+                count, cursor, prefetch, **kwargs
+            ):
+                yield video
+            return
+
         found = 0
         while found < count:
-            params = {
-                "challengeID": self.id,
-                "count": 35,
-                "cursor": cursor,
-            }
-
-            resp = await self.parent.make_request(
-                url="https://www.tiktok.com/api/challenge/item_list/",
-                params=params,
-                headers=kwargs.get("headers"),
-                session_index=kwargs.get("session_index"),
-            )
-
-            if resp is None:
-                raise InvalidResponseException(
-                    resp, "TikTok returned an invalid response."
-                )
+            resp = await self.__fetch_videos_page(cursor, **kwargs)
 
             for video in resp.get("itemList", []):
                 yield self.parent.video(data=video)
@@ -137,6 +130,63 @@ class Hashtag:
 
             cursor = resp.get("cursor")
 
+    async def __videos_read_ahead(self, count, cursor, prefetch, **kwargs):
+        """Yield videos while the next pages are fetched into a bounded buffer"""
+        pages = asyncio.Queue(maxsize=prefetch)
+
+        async def fetch_pages(cursor):
+            try:
+                found = 0
+                while found < count:
+                    resp = await self.__fetch_videos_page(cursor, **kwargs)
+                    await pages.put(resp)
+                    found += len(resp.get("itemList", []))
+
+                    if not resp.get("hasMore", False):
+                        break
+
+                    cursor = resp.get("cursor")
+            except Exception as e:
+                await pages.put(e)
+                return
+            await pages.put(None)
+
+        fetcher = asyncio.create_task(fetch_pages(cursor))
+        try:
+            while True:
+                resp = await pages.get()
+                if resp is None:
+                    return
+                if isinstance(resp, Exception):
+                    raise resp
+
+                for video in resp.get("itemList", []):
+                    yield self.parent.video(data=video)
+        finally:
+            # Waits for the fetcher to stop, the session may be handed over next
+            fetcher.cancel()
+            await asyncio.gather(fetcher, return_exceptions=True)
+
+    async def __fetch_videos_page(self, cursor, **kwargs) -> dict:
+        """Fetch one page of videos starting at cursor"""
+        params = {
+            "challengeID": self.id,
+            "count": 35,
+            "cursor": cursor,
+        }
+
+        resp = await self.parent.make_request(
+            url="https://www.tiktok.com/api/challenge/item_list/",
+            params=params,
+            headers=kwargs.get("headers"),
+            session_index=kwargs.get("session_index"),
+        )
+
+        if resp is None:
+            raise InvalidResponseException(resp, "TikTok returned an invalid response.")
+
+        return resp
+
     def __extract_from_data(self):
         data = self.as_dict
         keys = data.keys()
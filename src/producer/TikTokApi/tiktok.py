@@ -17,7 +17,6 @@ import dataclasses
 import json
 import logging
 import random
-import time
 from typing import Any
 from urllib.parse import quote, urlencode, urlparse
 
@@ -162,8 +161,12 @@ class TikTokApi:
         cookies: dict = None,
         suppress_resource_load_types: list[str] = None,
         sessions_regional_params: dict = {},
+        session_index: int = None,
     ):
-        """Create a TikTokPlaywrightSession"""
+        """Create a TikTokPlaywrightSession
+
+        If session_index is given the session at that index is replaced, otherwise the session is appended.
+        """
         if ms_token is not None:
             if cookies is None:
                 cookies = {}
@@ -210,16 +213,21 @@ class TikTokApi:
             base_url=url,
         )
         if ms_token is None:
-            time.sleep(sleep_after)  # TODO: Find a better way to wait for msToken
+            # TODO: Find a better way to wait for msToken
+            await asyncio.sleep(sleep_after)
             cookies = await self.get_session_cookies(session)
             ms_token = cookies.get("msToken")
             session.ms_token = ms_token
             if ms_token is None:
                 self.logger.info(
-                    f"Failed to get msToken on session index {len(self.sessions)}, you should consider specifying ms_tokens"
+                    f"Failed to get msToken on session index {len(self.sessions) if session_index is None else session_index}, you should consider specifying ms_tokens"
                 )
-        self.sessions.append(session)
+        if session_index is None:
+            self.sessions.append(session)
+        else:
+            self.sessions[session_index] = session
         await self.__set_session_params(session, **sessions_regional_params)
+        return session
 
     async def create_sessions(
         self,
@@ -293,6 +301,18 @@ class TikTokApi:
         else:
             raise ValueError("Invalid browser argument passed")
 
+        # Kept so sessions can be recreated later with the same options
+        self.session_options = {
+            "proxies": proxies,
+            "ms_tokens": ms_tokens,
+            "cookies": cookies,
+            "url": starting_url,
+            "context_options": context_options,
+            "sleep_after": sleep_after,
+            "suppress_resource_load_types": suppress_resource_load_types,
+            "sessions_regional_params": sessions_regional_params,
+        }
+
         await asyncio.gather(
             *(
                 self.__create_session(
@@ -310,6 +330,38 @@ class TikTokApi:
         )
         self.num_sessions = len(self.sessions)
 
+    async def recreate_session(self, session_index: int):
+        """
+        Replace the session at session_index with a new one, using the options passed to create_sessions.
+
+        Useful for long-lived browsers, where the msToken of a session expires or signing starts to fail.
+
+        Args:
+            session_index (int): The index of the session to replace.
+
+        Returns:
+            TikTokPlaywrightSession: The new session.
+        """
+        old_session = self.sessions[session_index]
+        try:
+            await old_session.page.close()
+            await old_session.context.close()
+        except Exception as e:
+            self.logger.warning(f"Failed to close session {session_index}: {e}")
+
+        options = self.session_options
+        return await self.__create_session(
+            proxy=random_choice(options["proxies"]),
+            ms_token=random_choice(options["ms_tokens"]),
+            url=options["url"],
+            context_options=options["context_options"],
+            sleep_after=options["sleep_after"],
+            cookies=random_choice(options["cookies"]),
+            suppress_resource_load_types=options["suppress_resource_load_types"],
+            sessions_regional_params=options["sessions_regional_params"],
+            session_index=session_index,
+        )
+
     async def close_sessions(self):
         """
         Close all the sessions. Should be called when you're done with the TikTokApi object
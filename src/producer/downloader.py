@@ -0,0 +1,120 @@
+import asyncio
+import socket
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import httpx
+
+from helpers.logging import setup_logger
+
+# Logs go to the log file of the producer replica
+logger = setup_logger(f"producer_{socket.gethostname().split('.')[-1]}")
+
+DEFAULT_HEADERS = {
+    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3",
+    "accept-encoding": "identity;q=1, *;q=0",
+    "referer": "https://www.tiktok.com/",
+}
+
+
+class VideoDownloader:
+    """
+    Async video downloader sharing one connection pool between all producer tasks
+
+    - The number of concurrent downloads from a single host is limited
+    - Interrupted downloads are resumed with a range request instead of starting over
+
+    Example Usage:
+        downloader = VideoDownloader()
+        async with aclosing(downloader.stream(url)) as chunks:
+            async for chunk in chunks:
+                ...
+        await downloader.close()
+    """
+
+    def __init__(
+        self,
+        max_connections=20,
+        per_host_limit=4,
+        timeout=30,
+        max_retries=3,
+        chunk_size=256 * 1024,
+    ):
+        """
+        Parameters:
+        - max_connections: int: Size of the shared connection pool
+        - per_host_limit: int: Concurrent downloads allowed from a single host
+        - timeout: int: Seconds to wait for a connection or the next chunk of data
+        - max_retries: int: Times an interrupted download is resumed before giving up
+        - chunk_size: int: Size of the chunks yielded by stream()
+        """
+        self.per_host_limit = per_host_limit
+        self.max_retries = max_retries
+        self.chunk_size = chunk_size
+
+        self.client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=httpx.Timeout(timeout),
+            follow_redirects=True,
+        )
+        self.host_semaphores = defaultdict(
+            lambda: asyncio.Semaphore(self.per_host_limit)
+        )
+
+    async def stream(self, url, headers=None):
+        """
+        Stream the content of a url in chunks, resuming after network errors
+
+        The download holds a slot of its host until the generator is closed, use it in
+        contextlib.aclosing so an abandoned download releases it right away.
+
+        Parameters:
+        - url: str: The url to download
+        - headers: dict: Extra request headers
+
+        Yields:
+        - bytes: Chunks of the response body
+        """
+        received = 0
+        attempt = 0
+
+        async with self.host_semaphores[urlparse(url).netloc]:
+            while True:
+                request_headers = {**(headers or {}), "range": f"bytes={received}-"}
+                try:
+                    async with self.client.stream(
+                        "GET", url, headers=request_headers
+                    ) as response:
+                        response.raise_for_status()
+
+                        # The server ignored the range, skip what was already yielded
+                        skip = received if response.status_code == 200 else 0
+
+                        async for chunk in response.aiter_bytes(self.chunk_size):
+                            if skip:
+                                if len(chunk) <= skip:
+                                    skip -= len(chunk)
+                                    continue
+                                chunk = chunk[skip:]
+                                skip = 0
+
+                            received += len(chunk)
+                            yield chunk
+                    return
+                except httpx.TransportError as e:
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        raise
+
+                    logger.warning(
+                        f"Download interrupted after {received} bytes ({e}), "
+                        f"resuming ({attempt}/{self.max_retries})"
+                    )
+                    await asyncio.sleep(2**attempt)
+
+    async def close(self):
+        await self.client.aclose()
@@ -1,16 +1,24 @@
 import asyncio
 import json
 import os
-import pickle
 import socket
+import time
+import uuid
+from contextlib import aclosing
 from datetime import datetime
 
 import aio_pika
-import requests
-from TikTokApi import TikTokApi
+from downloader import VideoDownloader
+from session_pool import SessionPool
 
+from helpers.blob_store import get_blob_store
 from helpers.logging import setup_logger
 from helpers.rabbitmq import RabbitMQClient
+from postgresql.config.db import session
+from postgresql.database_scripts.video_fingerprints import (
+    claim_video,
+    should_download_video,
+)
 
 # Get the hostname (e.g., producer.1, producer.2)
 hostname = socket.gethostname()
@@ -27,15 +35,71 @@ class TikTokProducer(RabbitMQClient):
         self.connection_name = f"tiktok_data_producer_{replica_number}"
         self.exchange_name = os.environ.get("RABBITMQ_EXCHANGE")
         self.tasks_queue = os.environ.get("RMQ_PRODUCER_TASKS_QUEUE")
-        self.semaphore = asyncio.Semaphore(1)  # Allow only 1 task at a time
+        # Control messages, such as task cancellations, are sent to every replica
+        # through the tasks exchange
+        self.tasks_exchange_name = os.environ.get("RMQ_TASKS_EXCHANGE")
+        self.control_queue = None
+
+        # Number of hashtag tasks crawled at the same time by this replica.
+        # Every task gets its own session in the shared browser.
+        self.concurrency = int(os.environ.get("PRODUCER_CONCURRENCY") or 3)
+        self.task_timeout = int(os.environ.get("PRODUCER_TASK_TIMEOUT") or 3600)
+        self.throughput_interval = int(
+            os.environ.get("PRODUCER_THROUGHPUT_INTERVAL") or 60
+        )
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+        # Long-lived browser with one session per concurrent task
+        self.session_pool = SessionPool(
+            size=self.concurrency,
+            health_check_interval=int(
+                os.environ.get("PRODUCER_SESSION_CHECK_INTERVAL") or 300
+            ),
+            max_session_age=int(os.environ.get("PRODUCER_SESSION_MAX_AGE") or 3600),
+        )
+        # Running hashtag tasks and their hashtags, by task id
+        self.running_tasks = {}
+        self.task_hashtags = {}
+        self.cancelled_tasks = set()
+
+        # Shared connection pool for video downloads
+        self.downloader = VideoDownloader(
+            max_connections=int(os.environ.get("PRODUCER_MAX_DOWNLOADS") or 20),
+            per_host_limit=int(os.environ.get("PRODUCER_DOWNLOADS_PER_HOST") or 4),
+            timeout=int(os.environ.get("PRODUCER_DOWNLOAD_TIMEOUT") or 30),
+        )
+        # Downloads a task can have in flight while it keeps paginating
+        self.downloads_per_task = int(
+            os.environ.get("PRODUCER_DOWNLOADS_PER_TASK") or 4
+        )
+        # Video bytes are stored out of band, messages only carry a reference
+        self.blob_store = get_blob_store()
+        # Seconds after which a video that was sent but never embedded is sent again
+        self.dedup_pending_timeout = int(
+            os.environ.get("PRODUCER_DEDUP_PENDING_TIMEOUT") or 21600
+        )
+        # Hashtag pages fetched ahead while the current one is processed
+        self.page_prefetch = int(os.environ.get("PRODUCER_PAGE_PREFETCH") or 1)
+
+        self.videos_collected = 0
+        self.started_at = time.monotonic()
 
     async def initialize(self):
         try:
             await self.connect(self.connection_name)
+            await self.session_pool.start()
             self.exchange = await self.channel.get_exchange(self.exchange_name)
             self.tasks_queue = await self.channel.get_queue(name=self.tasks_queue)
-            # Get only 1 message at a time
-            await self.channel.set_qos(prefetch_count=1)
+            # Get as many messages as we can crawl at the same time
+            await self.channel.set_qos(prefetch_count=self.concurrency)
+
+            # Every replica gets its own queue, the task may run on any of them
+            self.control_queue = await self.channel.declare_queue(
+                exclusive=True, auto_delete=True
+            )
+            await self.control_queue.bind(
+                exchange=self.tasks_exchange_name, routing_key="producer_control.#"
+            )
 
             logger.info(f"Initialized TikTokProducer")
             logger.debug(
@@ -44,10 +108,11 @@ class TikTokProducer(RabbitMQClient):
         except Exception as e:
             logger.error(f"Error initializing TikTokProducer: {e}")
 
-    async def produce_message(self, key, value):
+    async def produce_message(self, key, value, content_type=None):
         try:
             message = aio_pika.Message(
                 body=value.encode("utf-8") if isinstance(value, str) else value,
+                content_type=content_type,
                 delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
             )
             await self.exchange.publish(message, routing_key=str(key))
@@ -60,16 +125,91 @@ class TikTokProducer(RabbitMQClient):
     async def consume_tasks(self):
         try:
             await self.tasks_queue.consume(callback=self.process_tasks)
-            logger.info(f"Consuming tasks from queue: {self.tasks_queue.name}")
+            await self.control_queue.consume(callback=self.process_control)
+            logger.info(
+                f"Consuming tasks from queue: {self.tasks_queue.name} "
+                f"with concurrency {self.concurrency}"
+            )
+            reporter = asyncio.create_task(self.report_throughput())
             try:
                 await asyncio.Future()
             finally:
+                reporter.cancel()
+                for task in list(self.running_tasks.values()):
+                    task.cancel()
                 await self.connection.close()
+                await self.session_pool.close()
+                await self.downloader.close()
         except Exception as e:
             logger.error(f"Error consuming tasks: {e}")
 
+    def cancel_tasks(self, task_id=None, hashtag=None):
+        """
+        Cancel a running task, or all running tasks of a hashtag. The task messages are
+        acked and not rescheduled.
+
+        Parameters:
+        - task_id: str: The id of the task
+        - hashtag: str: The hashtag of the tasks
+
+        Returns:
+        - int: The number of cancelled tasks
+        """
+        cancelled = 0
+        for running_id, task in list(self.running_tasks.items()):
+            if running_id == task_id or (
+                hashtag is not None and self.task_hashtags.get(running_id) == hashtag
+            ):
+                self.cancelled_tasks.add(running_id)
+                task.cancel()
+                cancelled += 1
+        return cancelled
+
+    async def process_control(self, message: aio_pika.IncomingMessage):
+        """
+        Handle a control message, producer_control.cancel cancels the tasks matching
+        the task_id or the hashtag of its body
+        """
+        async with message.process():
+            try:
+                command = message.routing_key.split(".")[1]
+                params = json.loads(message.body.decode("utf-8"))
+
+                if command == "cancel":
+                    cancelled = self.cancel_tasks(
+                        task_id=params.get("task_id"), hashtag=params.get("hashtag")
+                    )
+                    if cancelled:
+                        logger.info(f"Cancelled {cancelled} tasks for {params}")
+                else:
+                    logger.warning(f"Unknown control message: {message.routing_key}")
+            except Exception as e:
+                logger.error(f"Error processing control message: {e}")
+
+    async def report_throughput(self):
+        """
+        Periodically log the throughput of this replica in videos per minute
+        """
+        last_count = self.videos_collected
+        while True:
+            await asyncio.sleep(self.throughput_interval)
+
+            count = self.videos_collected
+            if count == last_count and not self.running_tasks:
+                continue
+
+            interval_rate = (count - last_count) / (self.throughput_interval / 60)
+            average_rate = count / ((time.monotonic() - self.started_at) / 60)
+            logger.info(
+                f"Throughput: {interval_rate:.1f} videos/min "
+                f"(average {average_rate:.1f} videos/min, "
+                f"{len(self.running_tasks)} tasks running)"
+            )
+            last_count = count
+
     async def process_tasks(self, message: aio_pika.IncomingMessage):
-        async with self.semaphore:  # Ensure only one task runs at a time
+        async with self.semaphore:  # Limit the number of tasks running at a time
+            task_params = None
             try:
                 async with message.process(requeue=True):
                     routing_key = message.routing_key
@@ -79,16 +219,47 @@ class TikTokProducer(RabbitMQClient):
                     logger.info(f"Processing {task_type} task: {task_params}")
 
                     if task_type == "hashtag_search":
-                        await self.get_hashtag_videos(
-                            hashtag=task_params["hashtag"],
-                            num_videos=task_params["num_videos"],
-                            scheduled_at=task_params["timestamp"],
-                        )
+                        # Tasks sent before task ids existed get one of their own
+                        task_id = task_params.get("task_id") or uuid.uuid4().hex
+                        await self.run_hashtag_task(task_id, task_params)
             except Exception as e:
                 logger.error(
                     f"Error {e} occurred while processing task {task_params}. Rescheduling!"
                 )
 
+    async def run_hashtag_task(self, task_id, task_params):
+        """
+        Run a hashtag search task as a separate asyncio task, so it can be cancelled on its own
+
+        Timed out and cancelled tasks are not rescheduled.
+        """
+        hashtag = task_params["hashtag"]
+        task = asyncio.create_task(
+            self.get_hashtag_videos(
+                hashtag=hashtag,
+                num_videos=task_params["num_videos"],
+                scheduled_at=task_params["timestamp"],
+            )
+        )
+        self.running_tasks[task_id] = task
+        self.task_hashtags[task_id] = hashtag
+
+        try:
+            await asyncio.wait_for(task, timeout=self.task_timeout)
+        except asyncio.TimeoutError:
+            logger.error(
+                f"Task for hashtag {hashtag} timed out after {self.task_timeout}s"
+            )
+        except asyncio.CancelledError:
+            if task_id not in self.cancelled_tasks:
+                # The producer is shutting down, let the message be rescheduled
+                raise
+            logger.warning(f"Task {task_id} for hashtag {hashtag} was cancelled")
+        finally:
+            self.running_tasks.pop(task_id, None)
+            self.task_hashtags.pop(task_id, None)
+            self.cancelled_tasks.discard(task_id)
+
     async def get_hashtag_videos(self, hashtag, scheduled_at, num_videos=5):
         logger.info(f"Getting {num_videos} videos for hashtag: {hashtag}")
 
@@ -97,60 +268,103 @@ class TikTokProducer(RabbitMQClient):
             second=0, microsecond=0
         )
 
-        async with TikTokApi() as api:
-            await api.create_sessions(num_sessions=1, sleep_after=3)
-
-            await asyncio.sleep(1)
-
-            tag = api.hashtag(name=hashtag)
-            async for video in tag.videos(count=num_videos):
-                video_dict = video.as_dict
-                await self.produce_message(
-                    key=f"tiktok.hashtag.{hashtag}",
-                    value=json.dumps(
-                        {
-                            **video_dict,
-                            "collected_at": collected_at.isoformat(),
-                        }
-                    ),
-                )
+        started_at = time.monotonic()
+        found = 0
+
+        # Videos are downloaded in the background while the next ones are fetched
+        download_slots = asyncio.Semaphore(self.downloads_per_task)
+        downloads = set()
 
+        async def download(video):
+            try:
                 await self.get_video_bytes(video)
-        logger.info(f"Finished getting videos for hashtag: {hashtag}")
+            finally:
+                download_slots.release()
+
+        try:
+            # Borrow a warm session, so concurrent tasks don't share the same page
+            async with self.session_pool.session() as session_index:
+                tag = self.session_pool.api.hashtag(name=hashtag)
+                # Closed before the session is given back, its read-ahead task
+                # stops paging with it
+                async with aclosing(
+                    tag.videos(
+                        count=num_videos,
+                        prefetch=self.page_prefetch,
+                        session_index=session_index,
+                    )
+                ) as videos:
+                    async for video in videos:
+                        video_dict = video.as_dict
+                        await self.produce_message(
+                            key=f"tiktok.hashtag.{hashtag}",
+                            value=json.dumps(
+                                {
+                                    **video_dict,
+                                    "collected_at": collected_at.isoformat(),
+                                }
+                            ),
+                        )
+
+                        await download_slots.acquire()
+                        task = asyncio.create_task(download(video))
+                        downloads.add(task)
+                        task.add_done_callback(downloads.discard)
+
+                        found += 1
+                        self.videos_collected += 1
+
+            await asyncio.gather(*downloads)
+        finally:
+            for task in downloads:
+                task.cancel()
+
+        elapsed_minutes = (time.monotonic() - started_at) / 60
+        logger.info(
+            f"Finished getting {found} videos for hashtag: {hashtag} "
+            f"({found / max(elapsed_minutes, 1e-6):.1f} videos/min)"
+        )
 
     async def get_video_bytes(self, video):
         """
-        Get video bytes for a given video url
+        Download the video into the blob store and publish a reference to it
+
+        Videos that were already embedded, or are still being processed, are skipped.
+        The same video shows up under several hashtags and in every collection round.
 
         Parameters:
         video: TikTokApi.Video containing video url
         """
+        post_id = video.as_dict["id"]
         try:
-            s = requests.Session()
-            h = {
-                "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3",
-                "range": "bytes=0-",
-                "accept-encoding": "identity;q=1, *;q=0",
-                "referer": "https://www.tiktok.com/",
-            }
+            async with session() as s:
+                if not await should_download_video(
+                    post_id, self.dedup_pending_timeout, s
+                ):
+                    return
 
             video_url = video.as_dict["video"]["bitrateInfo"][0]["PlayAddr"]["UrlList"][
                 -1
             ]
-            audio_url = video.as_dict["music"]["playUrl"]
 
-            # Download the video stream
-            video_response = s.get(video_url, headers=h)
+            # Stream the video straight into the blob store
+            # The audio stream is not downloaded, only the video bytes are sent for now
+            # Closing the stream releases its host slot even if the download failed
+            async with aclosing(self.downloader.stream(video_url)) as chunks:
+                video_ref = await self.blob_store.put_stream(chunks)
 
-            # Don't download the audio stream if it is music because of copyright issues
-            if video.as_dict["music"]["title"] == "original sound":
-                # Download the audio stream
-                audio_response = s.get(audio_url, headers=h)
+            # Another replica may have downloaded the same video in the meantime
+            async with session() as s:
+                async with s.begin():
+                    claimed = await claim_video(
+                        post_id, video_ref["sha256"], self.dedup_pending_timeout, s
+                    )
+            if not claimed:
+                return
 
-            body = pickle.dumps(
+            body = json.dumps(
                 {
-                    "video": video_response.content,
-                    # "audio": audio_response.content,
+                    "video": video_ref,
                     "description": video.as_dict["desc"],
                 }
             )
@@ -161,7 +375,7 @@ class TikTokProducer(RabbitMQClient):
             return
 
         await self.produce_message(
-            key=f"tiktok.bytes.{video.as_dict['id']}",
-            # For now we are only sending the video bytes
+            key=f"tiktok.bytes.{post_id}",
             value=body,
+            content_type="application/json",
         )
@@ -0,0 +1,209 @@
+import asyncio
+import socket
+import time
+from contextlib import asynccontextmanager
+
+from TikTokApi import TikTokApi
+from TikTokApi.exceptions import (
+    CaptchaException,
+    EmptyResponseException,
+    InvalidJSONException,
+    InvalidResponseException,
+)
+
+from helpers.logging import setup_logger
+
+# Logs go to the log file of the producer replica
+logger = setup_logger(f"producer_{socket.gethostname().split('.')[-1]}")
+
+# Any TikTok API url works for checking that a session can still sign requests
+HEALTH_CHECK_URL = "https://www.tiktok.com/api/challenge/detail/?challengeName=tiktok"
+
+# Errors after which TikTok no longer trusts the session: a captcha, a blocked or empty
+# response
+SESSION_ERRORS = (
+    CaptchaException,
+    EmptyResponseException,
+    InvalidJSONException,
+    InvalidResponseException,
+)
+
+
+class SessionPool:
+    """
+    A pool of TikTok sessions living in one long-lived Playwright browser
+
+    Sessions are warmed up once at startup and lent to tasks, so a task doesn't have to
+    launch a browser of its own. Before a session is lent it is checked and recycled if
+    its msToken expired, it can no longer generate X-Bogus signatures or it got too old.
+
+    Example Usage:
+        pool = SessionPool(size=3)
+        await pool.start()
+
+        async with pool.session() as session_index:
+            async for video in pool.api.hashtag(name="svt").videos(session_index=session_index):
+                ...
+    """
+
+    def __init__(
+        self,
+        size=1,
+        sleep_after=3,
+        health_check_interval=300,
+        max_session_age=3600,
+        sign_timeout=10,
+    ):
+        """
+        Parameters:
+        - size: int: Number of sessions in the pool
+        - sleep_after: int: Seconds to wait for the msToken when a session is created
+        - health_check_interval: int: Seconds between health checks of a session
+        - max_session_age: int: Seconds after which a session is recycled
+        - sign_timeout: int: Seconds to wait for an X-Bogus signature during a health check
+        """
+        self.size = size
+        self.sleep_after = sleep_after
+        self.health_check_interval = health_check_interval
+        self.max_session_age = max_session_age
+        self.sign_timeout = sign_timeout
+
+        self.api = None
+        self.free_sessions = asyncio.Queue()
+        self.created_at = {}
+        self.checked_at = {}
+        self.unhealthy = set()
+
+    async def start(self):
+        """
+        Launch the browser and warm up all sessions
+        """
+        if self.api is not None:
+            return
+
+        self.api = TikTokApi()
+        await self.api.create_sessions(
+            num_sessions=self.size, sleep_after=self.sleep_after
+        )
+
+        now = time.monotonic()
+        for session_index in range(len(self.api.sessions)):
+            self.created_at[session_index] = now
+            self.checked_at[session_index] = now
+            self.free_sessions.put_nowait(session_index)
+
+        logger.info(f"Session pool started with {len(self.api.sessions)} sessions")
+
+    async def close(self):
+        if self.api is None:
+            return
+
+        try:
+            await self.api.close_sessions()
+            await self.api.stop_playwright()
+        except Exception as e:
+            logger.error(f"Error closing session pool: {e}")
+        finally:
+            self.api = None
+
+    @asynccontextmanager
+    async def session(self):
+        """
+        Borrow a healthy session for the duration of the block
+
+        Yields:
+        - int: The session index to pass to TikTokApi calls
+        """
+        session_index = await self.free_sessions.get()
+        try:
+            await self.ensure_healthy(session_index)
+            yield session_index
+        except SESSION_ERRORS as e:
+            logger.warning(f"Session {session_index} failed a request: {e}")
+            self.mark_unhealthy(session_index)
+            raise
+        except Exception:
+            # Check the session again before it is lent to the next task
+            self.checked_at[session_index] = 0
+            raise
+        finally:
+            self.free_sessions.put_nowait(session_index)
+
+    def mark_unhealthy(self, session_index):
+        """
+        Recycle the session the next time it is borrowed
+        """
+        self.unhealthy.add(session_index)
+
+    async def ensure_healthy(self, session_index):
+        now = time.monotonic()
+
+        if now - self.created_at[session_index] > self.max_session_age:
+            logger.info(f"Session {session_index} is too old")
+            self.unhealthy.add(session_index)
+        elif (
+            session_index not in self.unhealthy
+            and now - self.checked_at[session_index] > self.health_check_interval
+        ):
+            if not await self.check_health(session_index):
+                self.unhealthy.add(session_index)
+
+        if session_index in self.unhealthy:
+            await self.recycle(session_index)
+
+    async def check_health(self, session_index):
+        """
+        Check that the session still has a valid msToken and can sign urls
+
+        Returns:
+        - bool: True if the session is healthy
+        """
+        self.checked_at[session_index] = time.monotonic()
+        session = self.api.sessions[session_index]
+
+        try:
+            cookies = await session.context.cookies()
+            ms_token = next((c for c in cookies if c["name"] == "msToken"), None)
+            if ms_token is None:
+                logger.warning(f"Session {session_index} has no msToken")
+                return False
+
+            expires = ms_token.get("expires", -1)
+            if 0 < expires < time.time():
+                logger.warning(f"msToken of session {session_index} expired")
+                return False
+
+            # TikTok rotates the msToken cookie, keep the one sent with requests current
+            session.ms_token = ms_token["value"]
+
+            signature = await asyncio.wait_for(
+                self.api.generate_x_bogus(
+                    HEALTH_CHECK_URL, session_index=session_index
+                ),
+                timeout=self.sign_timeout,
+            )
+            if not signature or signature.get("X-Bogus") is None:
+                logger.warning(f"Session {session_index} failed to generate X-Bogus")
+                return False
+        except Exception as e:
+            logger.warning(f"Health check of session {session_index} failed: {e}")
+            return False
+
+        return True
+
+    async def recycle(self, session_index):
+        """
+        Replace the session with a new one in the same browser
+        """
+        logger.info(f"Recycling session {session_index}")
+        try:
+            await self.api.recreate_session(session_index)
+        except Exception as e:
+            # Leave it marked as unhealthy, the next borrower tries again
+            logger.error(f"Error recycling session {session_index}: {e}")
+            raise
+
+        now = time.monotonic()
+        self.created_at[session_index] = now
+        self.checked_at[session_index] = now
+        self.unhealthy.discard(session_index)
@@ -34,6 +34,12 @@ async def main():
     scheduler.add_job(tasks_manager.refresh_post_trends_view, "cron", hour=9, minute=0)
     scheduler.add_job(tasks_manager.refresh_post_trends_view, "cron", hour=17, minute=0)
 
+    # Create the partitions of the reporting tables ahead of time and apply retention
+    await tasks_manager.maintain_reporting_partitions()
+    scheduler.add_job(
+        tasks_manager.maintain_reporting_partitions, "cron", hour=0, minute=30
+    )
+
     # Compute related hashtag rules every 24 hours
     scheduler.add_job(
         tasks_manager.compute_related_hashtag_rules, "cron", hour=1, minute=30
@@ -1,6 +1,7 @@
 import datetime
 import json
 import os
+import uuid
 
 import aio_pika
 
@@ -10,6 +11,11 @@ from helpers.related_hashtags import compute_related_hashtags
 from postgresql.config.db import session
 from postgresql.database_models import AuthorTrends
 from postgresql.database_scripts.active_hashtags import get_active_hashtags
+from postgresql.database_scripts.reporting_partitions import (
+    REPORTING_TABLES,
+    create_partitions,
+    detach_old_partitions,
+)
 
 logger = setup_logger("tasks_manager")
 
@@ -21,6 +27,11 @@ class TasksManager(RabbitMQClient):
         self.exchange_name = os.environ.get("RMQ_TASKS_EXCHANGE", None)
         self.hashtags_to_monitor = list()
 
+        # Monthly partitions of the reporting tables created ahead of time
+        self.partitions_ahead = int(os.environ.get("REPORTING_PARTITIONS_AHEAD") or 3)
+        # Months of snapshots kept in the reporting tables, 0 keeps everything
+        self.retention_months = int(os.environ.get("REPORTING_RETENTION_MONTHS") or 0)
+
     async def initialize(self):
         try:
             await self.connect(self.connection_name)
@@ -49,11 +60,16 @@ class TasksManager(RabbitMQClient):
 
     async def update_hashtags_to_monitor(self):
         try:
+            monitored = {h.title for h in self.hashtags_to_monitor}
             async with session() as s:
                 self.hashtags_to_monitor = await get_active_hashtags(s)
                 logger.info(
                     f"Updated hashtags to monitor: {[h.title for h in self.hashtags_to_monitor]}"
                 )  # Log just the titles
+
+            # Stop crawling hashtags that are no longer monitored
+            for title in monitored - {h.title for h in self.hashtags_to_monitor}:
+                await self.cancel_producer_tasks(hashtag=title)
         except Exception as e:
             logger.error(f"Error updating hashtags to monitor: {e}", exc_info=True)
             self.hashtags_to_monitor = []  # Reset to empty list on error
@@ -62,6 +78,7 @@ class TasksManager(RabbitMQClient):
         try:
             for hashtag in self.hashtags_to_monitor:
                 task_data = {
+                    "task_id": uuid.uuid4().hex,
                     "hashtag": hashtag.title,  # Use the title attribute instead of the whole object
                     "num_videos": 500,
                     "timestamp": datetime.datetime.now().isoformat(),
@@ -73,6 +90,17 @@ class TasksManager(RabbitMQClient):
         except Exception as e:
             logger.error(f"Error sending tasks to queue: {e}", exc_info=True)
 
+    async def cancel_producer_tasks(self, task_id=None, hashtag=None):
+        """
+        Ask every producer replica to cancel a running task, or all running tasks of a
+        hashtag
+        """
+        await self.produce_message(
+            key="producer_control.cancel",
+            value=json.dumps({"task_id": task_id, "hashtag": hashtag}),
+        )
+        logger.info(f"Sent cancellation for task {task_id}, hashtag {hashtag}")
+
     async def refresh_post_trends_view(self):
         # Refreshes posts_trends materialized DB view
         try:
@@ -101,3 +129,24 @@ class TasksManager(RabbitMQClient):
             logger.info("Successfully refreshed author_trends materialized view")
         except Exception as e:
             logger.error(f"Error refreshing author_trends materialized view: {e}")
+
+    async def maintain_reporting_partitions(self):
+        """Create upcoming partitions of the reporting tables and detach expired ones"""
+        try:
+            async with session() as s:
+                async with s.begin():
+                    for table in REPORTING_TABLES:
+                        created = await create_partitions(
+                            table, self.partitions_ahead, s
+                        )
+                        if created:
+                            logger.info(f"Created partitions: {created}")
+
+                        if self.retention_months > 0:
+                            detached = await detach_old_partitions(
+                                table, self.retention_months, s
+                            )
+                            if detached:
+                                logger.info(f"Detached partitions: {detached}")
+        except Exception as e:
+            logger.error(f"Error maintaining reporting partitions: {e}", exc_info=True)
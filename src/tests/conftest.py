@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The services import the shared modules from src, e.g. helpers.blob_store
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
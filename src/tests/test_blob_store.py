@@ -0,0 +1,100 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+
+from helpers.blob_store import LocalBlobStore
+
+
+async def chunked(data, size=3):
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalBlobStore(str(tmp_path), chunk_size=4)
+
+
+def age(store, sha256, seconds):
+    past = time.time() - seconds
+    os.utime(store.path(sha256), (past, past))
+
+
+def test_put_bytes(store):
+    ref = store.put_bytes(b"video")
+
+    assert ref == {"sha256": hashlib.sha256(b"video").hexdigest(), "size": 5}
+    assert store.exists(ref["sha256"])
+    assert store.read_bytes(ref["sha256"]) == b"video"
+
+
+def test_put_stream(store):
+    data = b"a video in several chunks"
+    ref = asyncio.run(store.put_stream(chunked(data)))
+
+    assert ref == {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)}
+    assert store.read_bytes(ref["sha256"]) == data
+    assert os.listdir(os.path.join(store.root, "tmp")) == []
+
+
+def test_stream(store):
+    ref = store.put_bytes(b"0123456789")
+
+    async def read():
+        return [chunk async for chunk in store.stream(ref["sha256"])]
+
+    assert asyncio.run(read()) == [b"0123", b"4567", b"89"]
+
+
+def test_same_content_is_stored_once(store):
+    first = store.put_bytes(b"video")
+    second = asyncio.run(store.put_stream(chunked(b"video")))
+
+    assert first == second
+    blobs = [
+        name
+        for directory, _, files in os.walk(store.root)
+        if not directory.endswith("tmp")
+        for name in files
+    ]
+    assert blobs == [first["sha256"]]
+
+
+@pytest.mark.parametrize("put", ["bytes", "stream"])
+def test_storing_again_refreshes_the_age(store, put):
+    sha256 = store.put_bytes(b"video")["sha256"]
+    age(store, sha256, 3600)
+
+    if put == "bytes":
+        store.put_bytes(b"video")
+    else:
+        asyncio.run(store.put_stream(chunked(b"video")))
+
+    assert store.prune(60) == 0
+    assert store.exists(sha256)
+
+
+def test_prune(store):
+    old = store.put_bytes(b"old video")["sha256"]
+    new = store.put_bytes(b"new video")["sha256"]
+    age(store, old, 3600)
+
+    assert store.prune(60) == 1
+    assert not store.exists(old)
+    assert store.exists(new)
+
+
+def test_missing_blob(store):
+    with pytest.raises(FileNotFoundError):
+        store.read_bytes(hashlib.sha256(b"missing").hexdigest())
+
+
+def test_delete(store):
+    sha256 = store.put_bytes(b"video")["sha256"]
+    store.delete(sha256)
+    store.delete(sha256)
+
+    assert not store.exists(sha256)
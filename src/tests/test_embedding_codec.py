@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from helpers.embedding_codec import HEADER, decode_embeddings, encode_embeddings
+
+
+@pytest.fixture
+def embeddings():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(4, 16))
+
+
+def test_round_trip(embeddings):
+    frames, description, embedded = decode_embeddings(
+        encode_embeddings(list(embeddings[1:]), embeddings[0])
+    )
+
+    np.testing.assert_allclose(frames, embeddings[1:], rtol=1e-6)
+    np.testing.assert_allclose(description, embeddings[0], rtol=1e-6)
+    assert embedded.tolist() == [True, True, True]
+
+
+def test_without_description(embeddings):
+    frames, description, embedded = decode_embeddings(
+        encode_embeddings(list(embeddings))
+    )
+
+    np.testing.assert_allclose(frames, embeddings, rtol=1e-6)
+    assert description is None
+    assert embedded.all()
+
+
+def test_float16_halves_the_size(embeddings):
+    body32 = encode_embeddings(list(embeddings))
+    body16 = encode_embeddings(list(embeddings), dtype="float16")
+    frames, _, _ = decode_embeddings(body16)
+
+    assert len(body16) - HEADER.size == (len(body32) - HEADER.size) // 2
+    np.testing.assert_allclose(frames, embeddings, atol=1e-2)
+
+
+def test_failed_frames_keep_their_positions(embeddings):
+    frames, description, embedded = decode_embeddings(
+        encode_embeddings([None, embeddings[0], None, embeddings[1], None])
+    )
+
+    assert embedded.tolist() == [False, True, False, True, False]
+    np.testing.assert_allclose(frames, embeddings[:2], rtol=1e-6)
+    assert description is None
+
+
+def test_description_only(embeddings):
+    frames, description, embedded = decode_embeddings(
+        encode_embeddings([], embeddings[0], dtype="float16")
+    )
+
+    assert frames.shape == (0, 16)
+    np.testing.assert_allclose(description, embeddings[0], atol=1e-2)
+    assert len(embedded) == 0
+
+
+def test_empty():
+    frames, description, embedded = decode_embeddings(encode_embeddings([]))
+
+    assert len(frames) == 0
+    assert description is None
+    assert len(embedded) == 0
+
+
+def test_decoded_arrays_are_views(embeddings):
+    frames, _, _ = decode_embeddings(encode_embeddings(list(embeddings)))
+
+    assert not frames.flags.writeable
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"EMBS",
+        b"JSON" + bytes(12),
+        encode_embeddings([[1.0, 2.0]])[:-1],
+        encode_embeddings([[1.0, 2.0]]) + b"\0",
+    ],
+    ids=["short", "magic", "truncated", "trailing"],
+)
+def test_invalid_messages(body):
+    with pytest.raises(ValueError):
+        decode_embeddings(body)
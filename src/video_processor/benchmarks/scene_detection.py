@@ -0,0 +1,155 @@
+"""
+Benchmark of the downscaled, frame-skipping scene detection
+
+Every setting is compared to full resolution detection on every frame, the baseline:
+- fps: Frames decoded and processed per second, key frame selection included
+- speedup: fps compared to the baseline
+- matched: Baseline cuts found within --tolerance frames
+- missed / extra: Baseline cuts not found, and cuts the baseline didn't find
+- offset: Mean distance in frames between the matched cuts and the baseline
+
+Example Usage (from src/video_processor):
+    python benchmarks/scene_detection.py videos/*.mp4 --settings 1x1 2x1 4x1 2x2 4x3
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from key_frames import extract_key_frames
+from scenedetect import AdaptiveDetector
+
+
+class RecordingDetector:
+    """
+    Wraps a detector to record the cuts it reports
+    """
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.event_buffer_length = detector.event_buffer_length
+        self.cuts = []
+        self.frames = 0
+
+    def process_frame(self, frame_num, frame_img):
+        cuts = self.detector.process_frame(frame_num, frame_img)
+        self.cuts.extend(cuts)
+        self.frames = frame_num + 1
+        return cuts
+
+    def post_process(self, frame_num):
+        cuts = self.detector.post_process(frame_num)
+        self.cuts.extend(cuts)
+        self.frames = frame_num + 1
+        return cuts
+
+
+def parse_setting(setting):
+    downscale, stride = setting.split("x")
+    return int(downscale), int(stride)
+
+
+def run(video, downscale, stride, mode):
+    """
+    Returns:
+    - tuple: The cuts found, the number of frames and the elapsed seconds
+    """
+    detector = RecordingDetector(AdaptiveDetector())
+    start = time.perf_counter()
+    extract_key_frames(
+        video, mode=mode, downscale=downscale, stride=stride, detector=detector
+    )
+    return detector.cuts, detector.frames, time.perf_counter() - start
+
+
+def compare_cuts(baseline, cuts, tolerance):
+    """
+    Match every baseline cut to the closest unmatched cut within tolerance frames
+
+    Returns:
+    - tuple: Matched, missed and extra cuts, and the mean offset of the matched cuts
+    """
+    remaining = list(cuts)
+    offsets = []
+    for cut in baseline:
+        closest = min(remaining, key=lambda c: abs(c - cut), default=None)
+        if closest is not None and abs(closest - cut) <= tolerance:
+            remaining.remove(closest)
+            offsets.append(abs(closest - cut))
+
+    matched = len(offsets)
+    mean_offset = sum(offsets) / matched if matched else 0.0
+    return matched, len(baseline) - matched, len(remaining), mean_offset
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("videos", nargs="+", help="Video files to benchmark")
+    parser.add_argument(
+        "--settings",
+        nargs="+",
+        default=["2x1", "4x1", "1x2", "2x2", "4x3"],
+        help="Detection settings as DOWNSCALExSTRIDE",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=int,
+        default=5,
+        help="Frames a cut can move and still match the baseline",
+    )
+    parser.add_argument("--mode", default="first", help="Key frame selection mode")
+    args = parser.parse_args()
+
+    settings = [(1, 1)] + [s for s in map(parse_setting, args.settings) if s != (1, 1)]
+    totals = {
+        setting: {"frames": 0, "seconds": 0.0, "matched": 0, "missed": 0, "extra": 0}
+        for setting in settings
+    }
+    offsets = {setting: [] for setting in settings}
+
+    for path in args.videos:
+        with open(path, "rb") as f:
+            video = f.read()
+
+        baseline = None
+        for setting in settings:
+            cuts, frames, seconds = run(video, *setting, args.mode)
+            if baseline is None:
+                baseline = cuts
+
+            matched, missed, extra, offset = compare_cuts(
+                baseline, cuts, args.tolerance
+            )
+            total = totals[setting]
+            total["frames"] += frames
+            total["seconds"] += seconds
+            total["matched"] += matched
+            total["missed"] += missed
+            total["extra"] += extra
+            if matched:
+                offsets[setting].append(offset)
+
+    baseline_fps = totals[(1, 1)]["frames"] / totals[(1, 1)]["seconds"]
+    print(f"{len(args.videos)} videos, {totals[(1, 1)]['frames']} frames")
+    print(
+        f"{'downscale':>9} {'stride':>6} {'fps':>8} {'speedup':>7} "
+        f"{'matched':>7} {'missed':>6} {'extra':>5} {'offset':>6}"
+    )
+    for setting in settings:
+        total = totals[setting]
+        fps = total["frames"] / total["seconds"]
+        offset = (
+            sum(offsets[setting]) / len(offsets[setting]) if offsets[setting] else 0.0
+        )
+        print(
+            f"{setting[0]:>9} {setting[1]:>6} {fps:>8.1f} {fps / baseline_fps:>6.2f}x "
+            f"{total['matched']:>7} {total['missed']:>6} {total['extra']:>5} "
+            f"{offset:>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import io
+from collections import deque
+
+import av
+import cv2
+import numpy as np
+from scenedetect import AdaptiveDetector
+
+# How the key frame of a scene is chosen
+SELECTION_MODES = ("first", "middle", "sharpest")
+
+# Width frames are shrunk to before their sharpness is measured
+SHARPNESS_WIDTH = 360
+
+# Side of the difference hash, hashes have HASH_SIZE * HASH_SIZE bits
+HASH_SIZE = 8
+
+# Levels per BGR channel of the color histograms
+HISTOGRAM_LEVELS = 4
+
+# Share of the pixels whose color can differ between near duplicate frames
+MAX_HISTOGRAM_DISTANCE = 0.2
+
+
+def sharpness(frame):
+    """
+    Variance of the Laplacian, higher for sharper frames
+
+    Parameters:
+    - frame: av.VideoFrame: The decoded frame
+
+    Returns:
+    - float: The sharpness of the frame
+    """
+    # Measured on a smaller grayscale copy, scaled by the decoder
+    width = min(frame.width, SHARPNESS_WIDTH)
+    gray = frame.to_ndarray(
+        format="gray", width=width, height=frame.height * width // frame.width
+    )
+    return cv2.Laplacian(gray, cv2.CV_64F).var()
+
+
+class SceneFrameSelector:
+    """
+    Picks the key frame of a scene while its frames are decoded, without keeping them all
+
+    - first: The first frame of the scene
+    - middle: The middle frame of an evenly spaced sample of at most sample_size frames,
+      the sample is thinned out every time it fills up, so long scenes use bounded memory
+    - sharpest: The frame with the highest variance of the Laplacian
+
+    Frames are added as decoded av.VideoFrame, only the chosen one is converted to BGR.
+    """
+
+    def __init__(self, mode="first", sample_size=16):
+        if mode not in SELECTION_MODES:
+            raise ValueError(f"Unknown key frame selection mode: {mode}")
+
+        self.mode = mode
+        self.sample_size = sample_size
+        self.frame = None
+        self.score = None
+        self.sample = []
+        self.stride = 1
+        self.count = 0
+
+    def add(self, frame):
+        if self.mode == "first":
+            if self.frame is None:
+                self.frame = frame
+        elif self.mode == "sharpest":
+            score = sharpness(frame)
+            if self.score is None or score > self.score:
+                self.frame, self.score = frame, score
+        elif self.count % self.stride == 0:
+            self.sample.append(frame)
+            if len(self.sample) >= self.sample_size:
+                # Keep every other frame and sample half as often from now on
+                self.sample = self.sample[::2]
+                self.stride *= 2
+
+        self.count += 1
+
+    def key_frame(self):
+        if self.mode == "middle":
+            frame = self.sample[len(self.sample) // 2] if self.sample else None
+        else:
+            frame = self.frame
+        return frame.to_ndarray(format="bgr24") if frame is not None else None
+
+
+def iter_frames(video):
+    """
+    Decode the video bytes from memory
+
+    Yields:
+    - av.VideoFrame: The decoded frames, not converted to BGR yet
+    """
+    with av.open(io.BytesIO(video)) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        yield from container.decode(stream)
+
+
+def extract_key_frames(video, mode="first", downscale=1, stride=1, detector=None):
+    """
+    Detect the scenes of a video and pick one key frame per scene in a single decode
+
+    The detector reports a cut a few frames after it happened, so frames are only
+    given to the selector of their scene once no earlier cut can be reported anymore.
+
+    Scene detection can run on smaller frames and on every stride-th frame only, the
+    key frames are always returned at full resolution.
+
+    Parameters:
+    - video: bytes: The video bytes
+    - mode: str: How the key frame of a scene is chosen, one of SELECTION_MODES
+    - downscale: int: Factor frames are shrunk by for scene detection
+    - stride: int: Only every stride-th frame is used for scene detection
+    - detector: SceneDetector: The scene detector, AdaptiveDetector by default
+
+    Returns:
+    - key_frames: list: One frame per scene
+    """
+    if downscale < 1 or stride < 1:
+        raise ValueError("downscale and stride must be at least 1")
+
+    detector = detector or AdaptiveDetector()
+    lookahead = detector.event_buffer_length * stride
+
+    key_frames = []
+    cuts = deque()
+    pending = deque()
+    selector = SceneFrameSelector(mode)
+
+    def assign(frame_num, frame):
+        nonlocal selector
+        # Drop cuts this frame is already past, a new scene starts at the latest one
+        new_scene = False
+        while cuts and cuts[0] <= frame_num:
+            cuts.popleft()
+            new_scene = True
+        if new_scene and selector.count:
+            key_frames.append(selector.key_frame())
+            selector = SceneFrameSelector(mode)
+        selector.add(frame)
+
+    frame_num = -1
+    for frame_num, frame in enumerate(iter_frames(video)):
+        if frame_num % stride == 0:
+            # The scaling is done by the decoder while converting to BGR
+            detection_frame = frame.to_ndarray(
+                format="bgr24",
+                width=max(frame.width // downscale, 1),
+                height=max(frame.height // downscale, 1),
+            )
+            cuts.extend(detector.process_frame(frame_num, detection_frame))
+
+        pending.append((frame_num, frame))
+        while len(pending) > lookahead:
+            assign(*pending.popleft())
+
+    cuts.extend(detector.post_process(frame_num))
+    while pending:
+        assign(*pending.popleft())
+
+    if selector.count:
+        key_frames.append(selector.key_frame())
+
+    return key_frames
+
+
+def difference_hashes(frames, hash_size=HASH_SIZE):
+    """
+    Perceptual difference hashes of frames, similar frames have hashes differing in
+    few bits
+
+    Parameters:
+    - frames: list: BGR frames
+    - hash_size: int: Side of the hash
+
+    Returns:
+    - np.ndarray: One row of hash_size * hash_size booleans per frame
+    """
+    thumbnails = np.stack(
+        [
+            cv2.resize(
+                cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY),
+                (hash_size + 1, hash_size),
+                interpolation=cv2.INTER_AREA,
+            )
+            for frame in frames
+        ]
+    )
+    # Whether each pixel is brighter than its right neighbour
+    return (thumbnails[:, :, 1:] > thumbnails[:, :, :-1]).reshape(len(frames), -1)
+
+
+def color_histograms(frames, levels=HISTOGRAM_LEVELS):
+    """
+    Coarse color histograms of frames, the difference hash only sees brightness
+
+    Parameters:
+    - frames: list: BGR frames
+    - levels: int: Levels per channel, histograms have levels ** 3 bins
+
+    Returns:
+    - np.ndarray: One normalized histogram per frame
+    """
+    thumbnails = np.stack(
+        [cv2.resize(frame, (32, 32), interpolation=cv2.INTER_AREA) for frame in frames]
+    )
+    quantized = thumbnails.astype(np.int64) * levels // 256
+    bins = (quantized[..., 0] * levels + quantized[..., 1]) * levels + quantized[..., 2]
+    bins = bins.reshape(len(frames), -1)
+
+    histograms = np.zeros((len(frames), levels**3))
+    np.add.at(histograms, (np.arange(len(frames))[:, None], bins), 1)
+    return histograms / bins.shape[1]
+
+
+def drop_near_duplicates(frames, max_distance):
+    """
+    Drop key frames nearly identical to an earlier kept one
+
+    Frames are compared by the Hamming distance of their difference hashes and by
+    their color histograms, all pairs at once. A frame is dropped when an earlier kept
+    frame is within max_distance bits and MAX_HISTOGRAM_DISTANCE of it, so distinct
+    scenes survive even when they are cut back and forth.
+
+    Parameters:
+    - frames: list: BGR key frames in scene order
+    - max_distance: int: Hash bits near duplicates differ by at most, negative keeps all
+
+    Returns:
+    - list: The kept frames, in scene order
+    """
+    if max_distance < 0 or len(frames) < 2:
+        return frames
+
+    hashes = difference_hashes(frames)
+    hash_distances = np.count_nonzero(hashes[:, None] != hashes[None, :], axis=2)
+
+    histograms = color_histograms(frames)
+    # Total variation distance, the share of pixels that would have to change color
+    histogram_distances = (
+        np.abs(histograms[:, None] - histograms[None, :]).sum(axis=2) / 2
+    )
+
+    duplicates = (hash_distances <= max_distance) & (
+        histogram_distances <= MAX_HISTOGRAM_DISTANCE
+    )
+
+    kept = np.zeros(len(frames), dtype=bool)
+    for i in range(len(frames)):
+        kept[i] = not np.any(duplicates[i, kept])
+
+    return [frame for frame, keep in zip(frames, kept) if keep]
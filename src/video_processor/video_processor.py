@@ -1,26 +1,24 @@
 import asyncio
 import json
+import multiprocessing
 import os
 import pickle
 import sys
-import threading
-from typing import List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 import aio_pika
-import cv2
-import vertexai
-from google.oauth2 import service_account
-from ratelimit import limits, sleep_and_retry
-from scenedetect import (AdaptiveDetector, SceneManager, StatsManager,
-                         open_video)
-from vertexai.vision_models import (Image, MultiModalEmbeddingModel,
-                                    MultiModalEmbeddingResponse, Video,
-                                    VideoSegmentConfig)
+from key_frames import SELECTION_MODES
+from workers import extract_key_frames_from_blob, init_worker
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
+from helpers.blob_store import get_blob_store
+from helpers.embedding_codec import CONTENT_TYPE, DTYPE_CODES, encode_embeddings
+from helpers.embeddings import AsyncEmbeddingClient, get_embedding_provider
 from helpers.rabbitmq import RabbitMQClient
+from helpers.rate_limiter import get_rate_limiter
 
 
 class TikTokVideoProcessor(RabbitMQClient):
@@ -35,25 +33,85 @@ class TikTokVideoProcessor(RabbitMQClient):
         self.connection_name = "tiktok_video_processor"
         self.exchange_name = os.environ.get("RABBITMQ_EXCHANGE")
         self.input_queue = "video_bytes"
-        self.google_project_id = os.environ.get("GOOGLE_PROJECT_ID")
-        self.region = os.environ.get("REGION")
-        self.model = os.environ.get("MODEL")
+        # Frames are embedded concurrently, API calls under a rate limit shared by all
+        # messages and optionally by all replicas
+        embedding_provider = get_embedding_provider()
+        self.embedding_client = AsyncEmbeddingClient(
+            embedding_provider,
+            limiter=(
+                get_rate_limiter(
+                    "vertex_embeddings",
+                    calls_per_minute=int(os.environ.get("EMBEDDING_RATE_LIMIT") or 120),
+                )
+                if embedding_provider.rate_limited
+                else None
+            ),
+            concurrency=int(os.environ.get("EMBEDDING_CONCURRENCY") or 8),
+            max_retries=int(os.environ.get("EMBEDDING_MAX_RETRIES") or 5),
+            # Frames of the videos in flight are embedded together in batches
+            max_wait=int(os.environ.get("EMBEDDING_BATCH_WAIT_MS") or 50) / 1000,
+        )
+        # Frame kept for every scene: first, middle or sharpest
+        self.key_frame_selection = os.environ.get("KEY_FRAME_SELECTION") or "first"
+        if self.key_frame_selection not in SELECTION_MODES:
+            raise ValueError(
+                f"KEY_FRAME_SELECTION must be one of {SELECTION_MODES}, "
+                f"got {self.key_frame_selection}"
+            )
+        # Scene detection runs on frames shrunk by this factor and on every stride-th
+        # frame only, key frames are still taken at full resolution
+        self.detection_downscale = int(os.environ.get("SCENE_DETECTION_DOWNSCALE") or 1)
+        self.detection_stride = int(os.environ.get("SCENE_DETECTION_STRIDE") or 1)
+        # Key frames whose perceptual hashes differ by at most this many of their 64
+        # bits are embedded only once, negative embeds every key frame
+        self.duplicate_distance = int(
+            os.environ.get("KEY_FRAME_DUPLICATE_DISTANCE") or 10
+        )
+        # Precision of the embeddings sent to the embeddings consumer, float16 halves
+        # the messages and loses nothing when they are stored as halfvec
+        self.message_dtype = os.environ.get("EMBEDDING_MESSAGE_DTYPE") or "float32"
+        if self.message_dtype not in DTYPE_CODES:
+            raise ValueError(
+                f"EMBEDDING_MESSAGE_DTYPE must be one of {list(DTYPE_CODES)}, "
+                f"got {self.message_dtype}"
+            )
+        self.blob_store = get_blob_store()
+        # Hours a video is kept in the blob store
+        self.blob_retention = int(os.environ.get("BLOB_STORE_RETENTION") or 24)
+        # Key frames are extracted in worker processes, one video per worker at a time
+        self.workers = int(
+            os.environ.get("VIDEO_PROCESSOR_WORKERS") or os.cpu_count() or 1
+        )
+        self.worker_slots = asyncio.Semaphore(self.workers)
+        self.pool = self.create_pool()
+
+    def create_pool(self):
+        # Spawned workers don't inherit the connection and threads of the event loop
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        )
 
     async def initialize(self):
         try:
             await self.connect(self.connection_name)
             self.exchange = await self.channel.get_exchange(self.exchange_name)
             self.queue = await self.channel.get_queue(self.input_queue)
-            await self.channel.set_qos(prefetch_count=100)
+            # Enough messages for every worker and one waiting each, the rest stays
+            # in the queue for other processors
+            await self.channel.set_qos(prefetch_count=self.workers * 2)
 
             print(f"TikTokVideoProcessor initialized.")
         except Exception as e:
             print(f"Error while initializing TikTokVideoProcessor: {e}")
 
-    async def produce_message(self, key, value):
+    async def produce_message(self, key, body, content_type, headers=None):
         try:
             message = aio_pika.Message(
-                body=json.dumps(value).encode("utf-8"),
+                body=body,
+                content_type=content_type,
+                headers=headers,
                 delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
             )
             await self.exchange.publish(message, routing_key=str(key))
@@ -68,184 +126,156 @@ class TikTokVideoProcessor(RabbitMQClient):
         try:
             await self.queue.consume(callback=self.message_handler)
             print(f"Waiting for messages from queue: video_bytes")
+            pruner = asyncio.create_task(self.prune_blobs())
             try:
                 await asyncio.Future()
             finally:
+                pruner.cancel()
                 await self.connection.close()
+                self.pool.shutdown(cancel_futures=True)
         except Exception as e:
             print(f"Error consuming message: {e}")
 
+    async def prune_blobs(self):
+        """
+        Periodically delete videos older than the retention from the blob store
+        """
+        while True:
+            try:
+                deleted = await asyncio.to_thread(
+                    self.blob_store.prune, self.blob_retention * 3600
+                )
+                print(f"Pruned {deleted} videos from the blob store")
+            except Exception as e:
+                print(f"Error pruning blob store: {e}")
+            await asyncio.sleep(3600)
+
+    async def read_video(self, message: aio_pika.IncomingMessage):
+        """
+        Read the video reference and description of a message
+
+        Returns:
+        - blob_sha256: str: The SHA-256 of the video in the blob store
+        - description: str: The video description
+        - sha256: str: The SHA-256 of the video, None for legacy messages
+        """
+        if message.content_type != "application/json":
+            # Messages published before the blob store carry the pickled video bytes,
+            # they are stored so the workers read every video the same way
+            body = pickle.loads(message.body)
+            ref = await asyncio.to_thread(self.blob_store.put_bytes, body["video"])
+            return ref["sha256"], body["description"], None
+
+        body = json.loads(message.body)
+        sha256 = body["video"]["sha256"]
+        return sha256, body["description"], sha256
+
     async def message_handler(self, message: aio_pika.IncomingMessage):
         """
         Handle the incoming message
         """
         try:
             async with message.process(requeue=True):
-                body = pickle.loads(message.body)
                 id = message.routing_key.split(".")[-1]
-
-                # Run the blocking tasks in a separate thread to avoid blocking the main event loop
-                key_frames = await asyncio.to_thread(
-                    self.extract_key_frames, body["video"]
-                )
+                blob_sha256, description, sha256 = await self.read_video(message)
+                try:
+                    key_frames = await self.extract_key_frames(blob_sha256)
+                except FileNotFoundError:
+                    print(f"Video of post {id} is not in the blob store, skipping")
+                    return
                 print(f"Extracted {len(key_frames)} key frames")
 
                 # pre-process text
-                text_description = body["description"].strip().lower()
+                text_description = description.strip().lower()
 
-                # TODO: Calculate similarity between key frames and filter out similar frames
-                embeddings = await asyncio.to_thread(
-                    self.generate_embeddings, key_frames, text_description
+                # The description is embedded while the frames are
+                embeddings, description_embedding = await asyncio.gather(
+                    self.embedding_client.embed_frames(key_frames),
+                    self.embed_description(text_description),
+                )
+                embedded = sum(embedding is not None for embedding in embeddings)
+                print(f"Generated {embedded} of {len(embeddings)} embeddings")
+                if not embedded:
+                    # Not marked as embedded, a later collection round retries it
+                    print(f"No key frame of post {id} was embedded, skipping")
+                    return
+
+                # The content hash lets the embeddings consumer mark the video as
+                # done, only sent once every key frame and the description are
+                complete = embedded == len(embeddings) and (
+                    description_embedding is not None or not text_description
                 )
-                print(f"Generated {len(embeddings)} embeddings")
 
                 # Produce the message in the main thread (since it's non-blocking)
-                await self.produce_message(f"tiktok.embeddings.{id}", embeddings)
+                await self.produce_message(
+                    f"tiktok.embeddings.{id}",
+                    encode_embeddings(
+                        embeddings, description_embedding, self.message_dtype
+                    ),
+                    CONTENT_TYPE,
+                    headers=(
+                        {"content_sha256": sha256} if sha256 and complete else None
+                    ),
+                )
         except Exception as e:
             print(f"Error processing message: {e}")
 
-    # The following methods are blocking, doesn't benefit from being async
-    def extract_key_frames(self, video):
+    async def embed_description(self, description):
         """
-        Extract key frames from the video
-
-        Parameters:
-        - video: bytes: The video bytes
+        Embed the description of a video
 
         Returns:
-        - key_frames: list: The list of key frames
+        - list: The text embedding, None if the description is empty or failed
         """
-        thread_id = threading.get_ident()
-        # Save the video to a temp file
-        # This is not really elegant, but it works for now
-        with open(f"temp_{thread_id}.mp4", "wb") as f:
-            f.write(video)
+        if not description:
+            return None
 
         try:
-            video = open_video(f"temp_{thread_id}.mp4")
+            return await self.embedding_client.embed_text(description)
         except Exception as e:
-            print(f"Error opening video: {e}")
-            return []
-        scene_manager = SceneManager(stats_manager=StatsManager())
-        scene_manager.add_detector(AdaptiveDetector())
-        scene_manager.detect_scenes(
-            video, show_progress=False
-        )  # show_progress=True will the progress of splitting the video
-        scene_list = scene_manager.get_scene_list()
-
-        key_frames = []
+            print(f"Error generating description embedding: {e}")
+            return None
 
-        try:
-            cap = cv2.VideoCapture(f"temp_{thread_id}.mp4")
-
-            if len(scene_list) == 0:
-                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                res, frame = cap.read()
-                if res:
-                    key_frames.append(frame)
-
-            for scene in scene_list:
-                # TODO: Select middle frame not the first frame
-                start_frame = scene[0].get_frames()
-                cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-                res, frame = cap.read()
-                if res:
-                    key_frames.append(frame)
-        except Exception as e:
-            print(f"Error extracting key frames: {e}")
-        finally:
-            cap.release()
-
-        # Delete the temp file
-        os.remove(f"temp_{thread_id}.mp4")
-
-        return key_frames
-
-    @sleep_and_retry
-    @limits(calls=120, period=60)
-    def generate_embeddings(self, key_frames):
+    async def extract_key_frames(self, sha256):
         """
-        Generate embeddings for the key frames
+        Extract key frames from the video in a worker process
+
+        The video is decoded once from memory, one frame per scene is kept while the
+        scenes are detected. Waits for a free worker, so videos queue up in RabbitMQ
+        rather than in the pool.
 
         Parameters:
-        - key_frames: list: The list of key frames
-        - description: str: The description
+        - sha256: str: The SHA-256 of the video in the blob store
 
         Returns:
-        - embeddings: list: The list of embeddings
+        - key_frames: list: The list of key frames
+
+        Raises:
+        - FileNotFoundError: If the video is not in the blob store
+        - Exception: If the worker failed to extract the key frames
         """
-        embeddings_lst = []
-        for key_frame in key_frames:
+        async with self.worker_slots:
+            pool = self.pool
             try:
-                # Embed the descitption only one time
-                image_embeddings, text_embeddings = (
-                    self.get_image_video_text_embeddings(
-                        frame=key_frame,
-                        dimension=1408,
-                    )
+                return await asyncio.get_running_loop().run_in_executor(
+                    pool,
+                    extract_key_frames_from_blob,
+                    sha256,
+                    self.key_frame_selection,
+                    self.detection_downscale,
+                    self.detection_stride,
+                    self.duplicate_distance,
                 )
-
-                embeddings_lst.append(image_embeddings)
+            except FileNotFoundError:
+                raise
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory), the message is requeued
+                if pool is self.pool:
+                    print("Worker process died, restarting the pool")
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    self.pool = self.create_pool()
+                raise
             except Exception as e:
-                print(f"Error generating embeddings: {e}")
-
-        return embeddings_lst
-
-    def get_image_video_text_embeddings(
-        self,
-        # project_id: str,
-        # location: str,
-        frame,
-        # video_path: str,
-        contextual_text: Optional[str] = None,
-        dimension: Optional[int] = 1408,
-        # video_segment_config: Optional[VideoSegmentConfig] = None,
-    ) -> Tuple[List, List]:
-        """Example of how to generate multimodal embeddings from image, video, and text.
-
-        Args:
-            project_id: Google Cloud Project ID, used to initialize vertexai
-            location: Google Cloud Region, used to initialize vertexai
-            image_path: Path to image (local or Google Cloud Storage) to generate embeddings for.
-            video_path: Path to video (local or Google Cloud Storage) to generate embeddings for.
-            contextual_text: Text to generate embeddings for.
-            dimension: Dimension for the returned embeddings.
-                https://cloud.google.com/vertex-ai/docs/generative-ai/embeddings/get-multimodal-embeddings#low-dimension
-            video_segment_config: Define specific segments to generate embeddings for.
-                https://cloud.google.com/vertex-ai/docs/generative-ai/embeddings/get-multimodal-embeddings#video-best-practices
-        """
-        thread_id = threading.get_ident()
-        # This is not really elegant, but it works for now
-        cv2.imwrite(f"temp_{thread_id}.jpg", frame)
-
-        # Check if file exists
-        file_path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
-        if not os.path.exists(file_path):
-            print("Google credentials file not found")
-            raise FileNotFoundError("Google credentials file not found")
-
-        credentials = service_account.Credentials.from_service_account_file(file_path)
-
-        # Initialize vertexai
-        vertexai.init(
-            project=self.google_project_id,
-            location=self.region,
-            credentials=credentials,
-        )
-
-        model = MultiModalEmbeddingModel.from_pretrained("multimodalembedding@001")
-        image = Image.load_from_file(f"temp_{thread_id}.jpg")
-        # video = Video.load_from_file(video_path)
-
-        embeddings = model.get_embeddings(
-            image=image,
-            # video=video,
-            # video_segment_config=video_segment_config,
-            contextual_text=contextual_text,
-            dimension=dimension,
-        )
-
-        # Delete the temp file
-        os.remove(f"temp_{thread_id}.jpg")
-
-        return embeddings.image_embedding, embeddings.text_embedding
+                # Raised so the message is requeued instead of marked as embedded
+                print(f"Error extracting key frames: {e}")
+                raise
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import cv2
+from key_frames import drop_near_duplicates, extract_key_frames
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+from helpers.blob_store import get_blob_store
+
+# Blob store of the worker process, opened once by init_worker
+blob_store = None
+
+
+def init_worker():
+    """
+    Initialize a worker process of the video processor pool
+    """
+    global blob_store
+    blob_store = get_blob_store()
+    # Every core already runs a worker, OpenCV threads would only compete with them
+    cv2.setNumThreads(1)
+
+
+def extract_key_frames_from_blob(sha256, mode, downscale, stride, duplicate_distance):
+    """
+    Extract the key frames of a video in the blob store
+
+    Runs in a worker process, only the blob reference and the key frames are sent
+    between processes, the video itself is read by the worker.
+
+    Parameters:
+    - sha256: str: The SHA-256 of the video in the blob store
+    - mode: str: How the key frame of a scene is chosen
+    - downscale: int: Factor frames are shrunk by for scene detection
+    - stride: int: Only every stride-th frame is used for scene detection
+    - duplicate_distance: int: Hash bits near duplicate key frames differ by at most
+
+    Returns:
+    - key_frames: list: One frame per distinct scene
+
+    Raises:
+    - FileNotFoundError: If the video is not in the blob store
+    """
+    video = blob_store.read_bytes(sha256)
+    key_frames = extract_key_frames(
+        video, mode=mode, downscale=downscale, stride=stride
+    )
+
+    distinct = drop_near_duplicates(key_frames, duplicate_distance)
+    if len(distinct) < len(key_frames):
+        print(f"Dropped {len(key_frames) - len(distinct)} near duplicate key frames")
+    return distinct
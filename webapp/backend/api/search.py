@@ -1,21 +1,51 @@
 # api/search.py
+import asyncio
+
 import numpy as np
 from fastapi import APIRouter, File, Form, HTTPException, UploadFile
 from schemas.response import AuthorResponse, MatchResponse, PostResponse
 from sqlalchemy import text
-from vertexai.vision_models import Image, MultiModalEmbeddingModel
 
+from helpers.embeddings import get_embedding_provider
 from postgresql.config.db import session
+from postgresql.database_models.video_embeddings import (
+    ELEMENT_TYPES,
+    EMBEDDING_STORAGE,
+    FRAME_ELEMENT,
+)
 
 router = APIRouter()
 
+# Nearest embeddings fetched per requested post, posts have several key frames
+CANDIDATES_PER_RESULT = 4
+
+# Matches less similar to the query than this are not returned
+MIN_SIMILARITY = 0.2
+
+# Created when the module is imported and used by every search, EMBEDDING_PROVIDER and
+# EMBEDDING_PROJECTION are read once and need a restart to change. It has to be the
+# provider the video processor embeds the videos with
+embedding_provider = get_embedding_provider()
+
 
 @router.post("/api/search/multimodal")
 async def multimodal_search(
     query: str = Form(default=None),
     image: UploadFile = File(default=None),
+    element_type: str = Form(default=FRAME_ELEMENT),
+    exact: bool = Form(default=False),
+    ef_search: int = Form(default=100),
     limit: int = 3000,
 ) -> list[MatchResponse]:
+    """
+    Search posts by the similarity of their embeddings to a text or an image
+
+    element_type selects what is compared to the query: the key frames of the
+    videos, or their descriptions, which are far fewer rows to scan.
+
+    By default the nearest embeddings are found with the HNSW index, ef_search trades
+    latency for recall. exact compares the query to every embedding instead.
+    """
     print(f"Received request - query: {query}, image present: {image is not None}")
 
     if not query and not image:
@@ -23,32 +53,36 @@ async def multimodal_search(
             status_code=400, detail="Either query text or image is required"
         )
 
+    if element_type not in ELEMENT_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"element_type must be one of {', '.join(ELEMENT_TYPES)}",
+        )
+
+    if not 1 <= ef_search <= 1000:
+        raise HTTPException(
+            status_code=400, detail="ef_search must be between 1 and 1000"
+        )
+
     try:
-        model = MultiModalEmbeddingModel.from_pretrained("multimodalembedding@001")
         query_embedding = None
 
         if query:
             print(f"Processing text query: {query}")
             query = query.strip().lower()
-            embeddings = model.get_embeddings(contextual_text=query, dimension=1408)
-            query_embedding = embeddings.text_embedding
+            query_embedding = await asyncio.to_thread(
+                embedding_provider.embed_text, query
+            )
             print("Text embedding generated successfully")
 
         if image:
             print("Processing uploaded image")
             contents = await image.read()
-            with open("temp_search.jpg", "wb") as f:
-                f.write(contents)
-
-            image_obj = Image.load_from_file("temp_search.jpg")
-            embeddings = model.get_embeddings(image=image_obj, dimension=1408)
-            query_embedding = embeddings.image_embedding
+            query_embedding = await asyncio.to_thread(
+                embedding_provider.embed_image, contents
+            )
             print("Image embedding generated successfully")
 
-            import os
-
-            os.remove("temp_search.jpg")
-
         if not query_embedding:
             raise HTTPException(status_code=500, detail="Failed to generate embedding")
 
@@ -61,35 +95,102 @@ async def multimodal_search(
                 vector_str = "[" + ",".join(str(x) for x in query_embedding) + "]"
                 print(f"Vector string length: {len(vector_str)}")
 
-                search_query = text(
+                if exact:
+                    # Without index scans the nearest embeddings are found by a scan
+                    await s.execute(text("SET LOCAL enable_indexscan = off"))
+                else:
+                    await s.execute(
+                        text("SELECT set_config('hnsw.ef_search', :ef_search, true)"),
+                        {"ef_search": str(ef_search)},
+                    )
+                    # Keeps scanning the index until enough rows pass the filters
+                    await s.execute(
+                        text("SET LOCAL hnsw.iterative_scan = relaxed_order")
+                    )
+
+                # Stage one takes the nearest embeddings in index order, stage two
+                # keeps the best one of each post and joins the posts, so the cost of
+                # an HNSW search depends on the number of candidates, not on the size
+                # of the table.
+                # The element type and the storage type are inlined, the planner only
+                # uses the partial index of the element type when it is a constant, and
+                # the query has to have the type of the stored embeddings
+                if exact:
+                    # Every embedding close enough is a candidate
+                    nearest = f"""
+                    SELECT post_id, element_id, distance
+                    FROM (
+                        SELECT
+                            post_id,
+                            element_id,
+                            embedding <=> cast(:query_vector as {EMBEDDING_STORAGE})
+                                as distance
+                        FROM video_embeddings
+                        WHERE element_type = '{element_type}'
+                    ) scored
+                    WHERE distance < :max_distance
                     """
-                WITH ranked_embeddings AS (
-                    SELECT 
-                        p.*,
-                        ve.element_id,
-                        1 - (ve.embedding <=> cast(:query_vector as vector)) as cosine_similarity,
-                        ROW_NUMBER() OVER (
-                            PARTITION BY p.id 
-                            ORDER BY 1 - (ve.embedding <=> cast(:query_vector as vector)) DESC
-                        ) as rank
-                    FROM 
-                        video_embeddings ve
-                        JOIN posts p ON ve.post_id = p.id
-                    WHERE (1 - (ve.embedding <=> cast(:query_vector as vector))) > 0.2
+                else:
+                    nearest = f"""
+                    SELECT
+                        post_id,
+                        element_id,
+                        embedding <=> cast(:query_vector as {EMBEDDING_STORAGE})
+                            as distance
+                    FROM video_embeddings
+                    WHERE element_type = '{element_type}'
+                    ORDER BY distance
+                    LIMIT :candidates
+                    """
+
+                search_query = text(
+                    f"""
+                WITH nearest AS MATERIALIZED ({nearest}),
+                best AS (
+                    SELECT DISTINCT ON (post_id) post_id, element_id, distance
+                    FROM nearest
+                    WHERE distance < :max_distance
+                    ORDER BY post_id, distance
                 )
-                SELECT *
-                FROM ranked_embeddings
-                WHERE rank = 1
-                ORDER BY cosine_similarity DESC
+                SELECT
+                    p.*,
+                    b.element_id,
+                    1 - b.distance as cosine_similarity,
+                    (SELECT count(*) FROM nearest) as candidates_found,
+                    (SELECT max(distance) FROM nearest) as farthest_distance
+                FROM best b
+                JOIN posts p ON b.post_id = p.id
+                ORDER BY b.distance
                 LIMIT :search_limit
                 """
                 )
 
-                results = await s.execute(
-                    search_query, {"query_vector": vector_str, "search_limit": limit}
-                )
+                candidates = limit * CANDIDATES_PER_RESULT
+                max_distance = 1 - MIN_SIMILARITY
+                while True:
+                    results = await s.execute(
+                        search_query,
+                        {
+                            "query_vector": vector_str,
+                            "candidates": candidates,
+                            "max_distance": max_distance,
+                            "search_limit": limit,
+                        },
+                    )
+                    matches = results.fetchall()
+                    if exact or not matches or len(matches) >= limit:
+                        break
+
+                    # Posts with many close key frames took several candidates each,
+                    # more are fetched unless the index has no more close enough
+                    if (
+                        matches[0].candidates_found < candidates
+                        or matches[0].farthest_distance >= max_distance
+                    ):
+                        break
+                    candidates *= 2
+                    print(f"Found {len(matches)} posts, retrying with {candidates}")
 
-                matches = results.fetchall()
                 print(f"Found {len(matches)} matches")
 
                 if not matches: